@@ -0,0 +1,75 @@
+"""! @file aim_table.py
+    This file contains tables which turn a position in the thermal camera's
+    image into the number of encoder ticks through which the turret must turn
+    to point at it. The tables are worked out once at startup, so aiming at a
+    target needs only a lookup and an interpolation on each axis.
+"""
+
+from array import array
+
+## Encoder ticks in one turn of the yaw or pitch axis
+TICKS_PER_REV = 16384
+
+
+def pixel_angle(coord, count, fov, distortion=0.0):
+    """!
+    Find the angle from the middle of the camera's view to a point in the
+    image, along one axis.
+    @param coord The position of the point in pixels, with each pixel's
+           centre at a whole number; it may be a fraction of a pixel
+    @param count The number of pixels along the axis
+    @param fov The camera's field of view along the axis in degrees
+    @param distortion A radial lens distortion coefficient. Points at a
+           distance @c u from the middle, as a fraction of half the image,
+           are taken to be at @c u(1 + distortion u^2) / (1 + distortion),
+           so the edges of the image stay at the edges of the field of view
+           while positive values spread out the middle of the image
+    @return The angle in degrees, positive towards higher coordinates
+    """
+    u = (coord - (count - 1) / 2) / (count / 2)
+    if distortion:
+        u = u * (1 + distortion * u * u) / (1 + distortion)
+    return (fov / 2) * u
+
+
+class AimTable:
+    """!
+    The encoder ticks from the middle of the view to the centre of each
+    pixel along one axis, kept in an array. Positions between pixel centres
+    are interpolated, and positions past the outer pixel centres are
+    extrapolated along the outermost step.
+    """
+
+    def __init__(self, count, fov, distortion=0.0,
+                 ticks_per_rev=TICKS_PER_REV):
+        """!
+        Work out the table.
+        @param count The number of pixels along the axis
+        @param fov The camera's field of view along the axis in degrees
+        @param distortion A radial lens distortion coefficient, as used by
+               @c pixel_angle()
+        @param ticks_per_rev The encoder ticks in one turn of the axis
+        """
+        self.count = count
+        scale = ticks_per_rev / 360
+        self._ticks = array('f', (pixel_angle(pix, count, fov, distortion)
+                                  * scale for pix in range(count)))
+
+
+    def ticks(self, coord):
+        """!
+        Look up the encoder ticks for a position in the image.
+        @param coord The position in pixels, with each pixel's centre at a
+               whole number; it may be a fraction of a pixel
+        @return The distance in encoder ticks from the middle of the view
+        """
+        table = self._ticks
+        pix = int(coord)
+        if pix > coord:
+            pix -= 1
+        if pix < 0:
+            pix = 0
+        elif pix > self.count - 2:
+            pix = self.count - 2
+        low = table[pix]
+        return low + (table[pix + 1] - low) * (coord - pix)
@@ -0,0 +1,12 @@
+"""! @file machine.py
+    A stand-in for MicroPython's @c machine module on CPython. The I2C bus
+    has no devices on it; benchmarks use @c mlx90640.fake_i2c.FakeI2C.
+"""
+
+from pyb import Pin
+
+
+class I2C:
+
+    def __init__(self, *args, **kwargs):
+        pass
@@ -0,0 +1,16 @@
+"""! @file micropython.py
+    A stand-in for MicroPython's @c micropython module on CPython, where
+    code emitters are ignored and constants are plain values.
+"""
+
+
+def const(value):
+    return value
+
+
+def native(func):
+    return func
+
+
+def viper(func):
+    return func
@@ -0,0 +1,79 @@
+"""! @file pyb.py
+    A stand-in for MicroPython's @c pyb module on CPython, with just enough
+    of it for the turret's modules to be imported and their tasks set up.
+    Pins and timers do nothing, and interrupts are never really disabled.
+"""
+
+
+def disable_irq():
+    return True
+
+
+def enable_irq(state=True):
+    pass
+
+
+class _Board:
+    """!
+    Gives every pin name asked for, such as @c Pin.board.PA10.
+    """
+
+    def __getattr__(self, name):
+        return name
+
+
+class Pin:
+    IN = 0
+    OUT_PP = 1
+    OUT_OD = 17
+    PULL_UP = 1
+    board = _Board()
+
+    def __init__(self, name, mode=IN, pull=None, value=None):
+        self.name = name
+        self._value = value or 0
+
+    def value(self, value=None):
+        if value is None:
+            return self._value
+        self._value = value
+
+    def high(self):
+        self._value = 1
+
+    def low(self):
+        self._value = 0
+
+
+class _Channel:
+
+    def __init__(self):
+        self._compare = 0
+        self._percent = 0
+
+    def pulse_width_percent(self, value=None):
+        if value is None:
+            return self._percent
+        self._percent = value
+
+    def compare(self, value=None):
+        if value is None:
+            return self._compare
+        self._compare = value
+
+
+class Timer:
+    PWM = 0
+    ENC_AB = 10
+
+    def __init__(self, num, **kwargs):
+        self.num = num
+        self._counter = 0
+
+    def channel(self, num, mode=None, **kwargs):
+        return _Channel()
+
+    def counter(self, value=None):
+        if value is None:
+            return self._counter
+        self._counter = value
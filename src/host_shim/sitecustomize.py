@@ -0,0 +1,36 @@
+"""! @file sitecustomize.py
+    This file lets the turret's benchmarks run on a PC under CPython 3 as
+    well as under the MicroPython Unix port. CPython imports it at startup
+    when this directory is on @c PYTHONPATH, and it adds the MicroPython
+    built-ins which the code uses: @c const(), and @c gc.mem_alloc() and
+    @c gc.mem_free(). The MicroPython modules themselves, such as @c utime
+    and @c pyb, are stand-ins kept beside this file.
+
+    Heap figures come from @c tracemalloc, which only runs if the
+    environment variable @c SHIM_TRACE is set, as it slows everything down.
+    They count CPython's objects, which are several times the size of
+    MicroPython's, so only compare them with one another.
+"""
+
+import builtins
+import gc
+import os
+import tracemalloc
+
+## The heap size reported by @c gc.mem_free(), that of an STM32L476
+HEAP_SIZE = 96 * 1024
+
+builtins.const = lambda value: value
+
+if os.environ.get("SHIM_TRACE"):
+    tracemalloc.start()
+
+
+def _mem_alloc():
+    if not tracemalloc.is_tracing():
+        return 0
+    return tracemalloc.get_traced_memory()[0]
+
+
+gc.mem_alloc = _mem_alloc
+gc.mem_free = lambda: HEAP_SIZE - _mem_alloc()
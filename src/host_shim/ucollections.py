@@ -0,0 +1,5 @@
+"""! @file ucollections.py
+    A stand-in for MicroPython's @c ucollections module on CPython.
+"""
+
+from collections import *
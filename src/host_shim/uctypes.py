@@ -0,0 +1,83 @@
+"""! @file uctypes.py
+    A stand-in for MicroPython's @c uctypes module on CPython, with only the
+    scalar and bitfield types which the camera driver's register structures
+    use. A layout value holds the type in its top bits, the byte offset in
+    its low 17 bits and, for bitfields, the bit position and length at
+    @c BF_POS and @c BF_LEN, as in MicroPython.
+"""
+
+_TYPE_SHIFT = 27
+_OFFSET_MASK = (1 << 17) - 1
+
+UINT8 = 0 << _TYPE_SHIFT
+INT8 = 1 << _TYPE_SHIFT
+UINT16 = 2 << _TYPE_SHIFT
+INT16 = 3 << _TYPE_SHIFT
+BFUINT16 = 10 << _TYPE_SHIFT
+BF_POS = 17
+BF_LEN = 22
+LITTLE_ENDIAN = 0
+BIG_ENDIAN = 1
+
+
+class _Address:
+    """!
+    Stands in for a memory address: a buffer and an offset into it.
+    """
+
+    def __init__(self, buf, offset=0):
+        self.buf = buf
+        self.offset = offset
+
+    def __add__(self, delta):
+        return _Address(self.buf, self.offset + delta)
+
+
+def addressof(buf):
+    return _Address(buf)
+
+
+class struct:
+    """!
+    Big-endian fields of a buffer, read and written as attributes.
+    """
+
+    def __init__(self, address, layout, endian=BIG_ENDIAN):
+        object.__setattr__(self, "_buf", address.buf)
+        object.__setattr__(self, "_base", address.offset)
+        object.__setattr__(self, "_layout", layout)
+
+    def _field(self, name):
+        desc = self._layout[name]
+        return desc >> _TYPE_SHIFT, self._base + (desc & _OFFSET_MASK), desc
+
+    def __getattr__(self, name):
+        kind, offset, desc = self._field(name)
+        buf = self._buf
+        if kind < 2:
+            value = buf[offset]
+            return value - 0x100 if kind == 1 and value & 0x80 else value
+        word = buf[offset] << 8 | buf[offset + 1]
+        if kind == 2:
+            return word
+        if kind == 3:
+            return word - 0x10000 if word & 0x8000 else word
+        pos = (desc >> BF_POS) & 0x1F
+        bits = (desc >> BF_LEN) & 0x1F
+        return (word >> pos) & ((1 << bits) - 1)
+
+    def __setattr__(self, name, value):
+        kind, offset, desc = self._field(name)
+        buf = self._buf
+        if kind < 2:
+            buf[offset] = value & 0xFF
+            return
+        if kind < 4:
+            word = value & 0xFFFF
+        else:
+            pos = (desc >> BF_POS) & 0x1F
+            mask = ((1 << ((desc >> BF_LEN) & 0x1F)) - 1) << pos
+            word = buf[offset] << 8 | buf[offset + 1]
+            word = (word & ~mask) | ((value << pos) & mask)
+        buf[offset] = word >> 8
+        buf[offset + 1] = word & 0xFF
@@ -0,0 +1,33 @@
+"""! @file utime.py
+    A stand-in for MicroPython's @c utime module on CPython. Ticks count up
+    from an arbitrary start and never wrap, so @c ticks_diff() is a plain
+    subtraction.
+"""
+
+import time
+
+from time import sleep
+
+
+def ticks_us():
+    return time.perf_counter_ns() // 1000
+
+
+def ticks_ms():
+    return time.perf_counter_ns() // 1000000
+
+
+def ticks_diff(ticks1, ticks2):
+    return ticks1 - ticks2
+
+
+def ticks_add(ticks, delta):
+    return ticks + delta
+
+
+def sleep_ms(ms):
+    time.sleep(ms / 1000)
+
+
+def sleep_us(us):
+    time.sleep(us / 1000000)
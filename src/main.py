@@ -9,8 +9,14 @@ import pyb
 from machine import I2C
 import cotask
 import task_share
-from mlx_cam import MLX_Cam
+from mlx_cam import MLX_Cam, ACQ_BUSY, ACQ_FRAME
 from mlx_raw.mlx90640.calibration import NUM_ROWS, NUM_COLS
+from target_search import SubpageBlockSearch, BruteForceSearch, \
+    IntegralBlockSearch, ColumnSumSearch, TopBlockSearch, ForegroundFilter, \
+    block_centroid
+from target_queue import TargetQueue
+from target_tracker import AlphaBetaTracker
+from aim_table import AimTable, TICKS_PER_REV, pixel_angle
 import motor_driver
 import encoder_reader
 import clp_controller
@@ -18,78 +24,337 @@ import gc
 import utime
 
 
+## The height and width of the blocks of pixels summed to find a target
+BLOCK_SIZE = 5
+
+## The camera's field of view across its columns (x) and down its rows (y),
+#  in degrees
+FOV_X = 55
+FOV_Y = 35
+
+## The camera lens's radial distortion coefficient, as used by
+#  @c aim_table.pixel_angle(); zero takes angles to be in proportion to
+#  distances in the image
+LENS_DISTORTION = 0.0
+
+## If True, the target is found again from each subpage as it arrives, using
+#  only the pixels which changed; if False, it is found from whole frames
+INCREMENTAL_TARGETING = True
+
+## The search used on whole frames when @c INCREMENTAL_TARGETING is False:
+#  @c IntegralBlockSearch is quickest, @c ColumnSumSearch needs far less
+#  memory, and @c BruteForceSearch needs none but is slow
+FRAME_SEARCH = IntegralBlockSearch
+
+## The most targets found in each image. If more than one, the hottest
+#  blocks which don't overlap are queued, and once a target has been dealt
+#  with the next is aimed at without reading the camera again
+TARGET_COUNT = 3
+
+## Of several targets found in an image, those whose blocks add up to less
+#  than this fraction of the best block's are dropped, so the edges of a
+#  target aren't queued as targets of their own
+TARGET_FRACTION = 0.25
+
+## If not @c None, targets are searched for in how far each pixel is above
+#  a background learned over about 2 ** FOREGROUND_SHIFT subpages, rather
+#  than in the pixels themselves, so warm things which stay put are ignored
+FOREGROUND_SHIFT = 5
+
+## Images whose pixels add up to less than this above the background (in
+#  raw camera counts) hold no target and aren't searched
+FOREGROUND_MIN = 200
+
+## Once a target is found, only a window of this many (rows, columns) around
+#  it is read from the camera, with a whole frame now and then; @c None
+#  reads whole frames all the time
+TRACK_WINDOW = (10, 10)
+
+## Pixels no hotter than this, in the units of the image searched, add
+#  nothing to the centre of a target found within its block; @c None uses
+#  the coolest pixel of the block
+CENTROID_BACKGROUND = None
+
+## The gains @c (alpha, beta) of the filter which follows a target once it
+#  is being aimed at, so the aim can be kept ahead of a moving target;
+#  @c None aims where the target was last seen and stops reading the camera
+TRACKER_GAINS = (0.7, 0.4)
+
+## How far ahead, in milliseconds, a tracked target's position is predicted
+#  when it is aimed at. This is a tuning constant, not a measured delay: it
+#  should cover the time the motors take to reach the setpoints, the shoot
+#  task's 200 ms before the plunger fires and the dart's flight. Tune it on
+#  the turret, or compare values with @c turret_bench.bench_tracker(), which
+#  runs this task on a simulated scene and turret
+AIM_LEAD_MS = 400
+
+## How many times a target is measured before it is aimed at, so that its
+#  velocity is known when the turret moves
+TRACK_UPDATES = 3
+
+## How far, in encoder ticks on either axis, the block found nearest to a
+#  followed target may be from where the target was predicted to be; one
+#  further away is taken to be something else, and if nothing nearer is
+#  found for a second the target is taken to be lost. About a block's width
+TRACK_GATE = 400
+
+
 def process_target(coord, axis):
     """!
-        This helper function, used by 'get_target_task1,' converts an x or y
-        coordinate from the thermal camera into a distance in encoder ticks. 
-        Task 1 will call this function twice upon finding the optimal coordinate 
-        in the csv output of the thermal camera. This conversion is based on the 
-        55 by 35 degree field of view of the thermal camera and the 16384 
-        encoder ticks in a 360 degree rotation.
-        @param  coord  An x or y coordinate from the thermal camera.
+        This helper function converts an x or y coordinate from the thermal 
+        camera into a distance in encoder ticks. This conversion is based on 
+        the 55 by 35 degree field of view of the thermal camera, 55 degrees
+        across its 32 columns and 35 down its 24 rows, and the 16384 encoder
+        ticks in a 360 degree rotation. 'get_target_task1' looks the same 
+        values up in tables made with @c aim_table.AimTable, which is quicker.
+        @param  coord  An x or y coordinate from the thermal camera, in pixels
+                with each pixel's centre at a whole number. It may be a
+                fraction of a pixel.
         @param  axis  A boolean representing whether the given coord is an x or 
                 y coordinate. True is for x coordinates and False for y.
         @return A distance in encoder ticks that either the pitch or yaw motor 
                 will need to rotate.
         """
     if axis:
-        cam_dist = coord - NUM_ROWS / 2
-        angle = (55 / 2) * (cam_dist / (NUM_ROWS / 2))
+        angle = pixel_angle(coord, NUM_COLS, FOV_X, LENS_DISTORTION)
+    else:
+        angle = pixel_angle(coord, NUM_ROWS, FOV_Y, LENS_DISTORTION)
+
+    return angle * (TICKS_PER_REV / 360)
+
+
+def locate_target(image, target, as_read, aim):
+    """!
+        This helper function, used by 'get_target_task1,' finds where a 
+        target is in encoder ticks from the block of pixels in which it was
+        found, using the centre of the block weighted by the heat of each
+        pixel.
+        @param  image  The image in which the target was found.
+        @param  target  A tuple (row, col, total) giving the top left pixel of
+                the target's block, with columns mirrored as in the csv output.
+        @param  as_read  True if the image has columns as read by the camera
+                rather than mirrored.
+        @param  aim  A tuple of the 'AimTable' objects for the x and y axes.
+        @return A tuple (dist_x, dist_y) of distances in encoder ticks.
+        """
+    row_idx, col_idx, _ = target
+    if as_read:
+        mid_row, mid_col = block_centroid(
+            image, row_idx, NUM_COLS - BLOCK_SIZE - col_idx, BLOCK_SIZE,
+            CENTROID_BACKGROUND)
+        mid_col = NUM_COLS - 1 - mid_col
     else:
-        cam_dist = coord - NUM_COLS / 2
-        angle = (35 / 2) * (cam_dist / (NUM_COLS / 2))
+        mid_row, mid_col = block_centroid(
+            image, row_idx, col_idx, BLOCK_SIZE, CENTROID_BACKGROUND)
 
-    return angle * (16384 / 360)
+    return aim[0].ticks(mid_col), aim[1].ticks(mid_row)
 
 
 def get_target_task1(shares):
     """!
-        This task acquires the optimal target from the thermal camera. First, 
-        the csv data from the thermal camera is parsed. Then an algorithm is 
-        implemented to determine the best target. This algorithm divides the 
-        output grid from the camera into 5 by 5 blocks and calculates the total
-        sum of each block. The optimal target is considered to be the center 
-        coordinate of the block with the greatest sum. This coordinate is 
-        processed into encoder ticks, which are added to the relevent shares. 
-        Lastly, a flag is set indicating that a target has been acquired.
+        This task acquires the optimal target from the thermal camera.
+        First, the scaled thermal camera data is written into a buffer kept
+        for the purpose. Then an algorithm is implemented to determine the
+        best target. This algorithm divides the output grid from the camera
+        into 5 by 5 blocks and calculates the total sum of each block, by
+        default from a summed-area table. The optimal target is considered to
+        be the center coordinate of the block with the greatest sum, refined
+        to a fraction of a pixel by weighting each pixel in the block by its
+        heat. This coordinate is processed into encoder ticks, which are added
+        to the relevent shares. Lastly, a flag is set indicating that a target
+        has been acquired.
+        Frames are read a piece at a time with the camera's @c acquire()
+        generator, so the motor tasks keep running while an image comes in.
+        If @c INCREMENTAL_TARGETING is set, the block sums are updated from
+        each subpage as it arrives, giving a new target twice per frame.
+        If @c TARGET_COUNT is more than one, each search finds up to that
+        many targets which don't overlap, leaving out any much cooler than
+        the best, and the ones not yet aimed at wait in a queue to be used
+        before the camera is read again.
+        If @c FOREGROUND_SHIFT is set, the search is done on how far each
+        pixel is above a slowly learned background, and images with too
+        little above it are passed over.
+        If @c TRACK_WINDOW is set, the camera reads only a window around the
+        best target of the last frame until the target leaves it or fades
+        below @c FOREGROUND_MIN, and only the pixels read are learned from.
+        If @c TRACKER_GAINS is set, a target is followed with the camera,
+        using the block found nearest to it in each new image to update a
+        filter which estimates its velocity. After @c TRACK_UPDATES
+        measurements the target counts as acquired, and from then on the
+        shares are given where it is predicted to be @c AIM_LEAD_MS ahead.
         @param  shares  This task requires access to the 'target_x,' 'target_y,'
                 and 'targ_acquired' shares, to which it will write values.
         """
     target_x_share, target_y_share, targ_acquired_share, = shares
 
     i2c_bus = I2C(1)
-    camera = MLX_Cam(i2c_bus)
+    camera = MLX_Cam(i2c_bus, frames=2, window=TRACK_WINDOW)
+    acquisition = camera.acquire()
+    if INCREMENTAL_TARGETING:
+        # Totals are in raw counts when searching the foreground
+        search = SubpageBlockSearch(
+            BLOCK_SIZE, count=TARGET_COUNT, min_fraction=TARGET_FRACTION,
+            min_total=None if FOREGROUND_SHIFT is None else FOREGROUND_MIN)
+    elif TARGET_COUNT == 1:
+        search = FRAME_SEARCH(BLOCK_SIZE)
+    else:
+        # Whole frames are scaled before they are searched, so only the
+        # fraction of the best block is meaningful
+        search = TopBlockSearch(BLOCK_SIZE, TARGET_COUNT,
+                                min_fraction=TARGET_FRACTION)
+    targets = TargetQueue(TARGET_COUNT, name="targets")
+    if FOREGROUND_SHIFT is not None:
+        foreground = ForegroundFilter(FOREGROUND_SHIFT)
+    # Scaled whole frames, row by row with columns mirrored as in the CSV
+    cam_data = bytearray(NUM_ROWS * NUM_COLS)
+    if INCREMENTAL_TARGETING:
+        searched, as_read = search.pix, True
+    else:
+        searched, as_read = cam_data, False
+    if TRACKER_GAINS:
+        tracker = AlphaBetaTracker(*TRACKER_GAINS, gate=TRACK_GATE)
+    else:
+        tracker = None
+    aim = (AimTable(NUM_COLS, FOV_X, LENS_DISTORTION),
+           AimTable(NUM_ROWS, FOV_Y, LENS_DISTORTION))
+    was_acquired = False
+    # Whether the camera was read the last time round, how many subpages
+    # have been read since it last wasn't, and whether the images now hold
+    # only pixels read since then
+    reading = False
+    fresh = 0
+    current = False
 
     while True:
-        if not targ_acquired_share.get():
-            cam_data = []
-            image = camera.get_image()
-            for line in camera.get_csv(image, limits=(0, 99)):
-                row_data = list(map(int, line.split(',')))
-                cam_data.append(row_data)
-
-            max_sum = 0
-            block_size = 5
-            row_idx, col_idx = 0, 0
-            for row in range(len(cam_data) - block_size + 1):
-                for col in range(len(cam_data[0]) - block_size + 1):
-                    curr_sum = sum(
-                        sum(cam_data[row+i][col+j] for j in range(block_size)
-                            ) for i in range(block_size)
-                        )
-                    if curr_sum > max_sum:
-                        row_idx, col_idx = row, col
-                        max_sum = curr_sum
-            mid_row = row_idx + block_size // 2
-            mid_col = col_idx + block_size // 2
-
-            dist_y = process_target(mid_row, False)
-            dist_x = process_target(mid_col, True)
-
-            target_x_share.put(dist_x)
-            target_y_share.put(dist_y)
-            targ_acquired_share.put(1)
-            print("Target acquired.")
+        acquired = targ_acquired_share.get()
+        if tracker is not None and was_acquired and not acquired:
+            # The target has been dealt with, so stop following it
+            tracker.reset()
+        was_acquired = acquired
+        following = tracker is not None and tracker.valid
+
+        if following or not (acquired or targets.targets()):
+            if not reading:
+                # What the camera was left holding is old, so start afresh
+                # with whole frames
+                fresh = 0
+                current = False
+                if TRACK_WINDOW is not None:
+                    camera.track()
+            reading = True
+            state = next(acquisition)
+            found = None
+            if state != ACQ_BUSY:
+                fresh += 1
+                # A window frame begun before the pause leaves the rest of
+                # the image old, so it takes a whole frame
+                if (state == ACQ_FRAME and fresh >= 2
+                        and not camera.windowed):
+                    current = True
+
+            if INCREMENTAL_TARGETING:
+                if state != ACQ_BUSY:
+                    image, indices = camera.last_subpage()
+                    pix = image.pix
+                    if FOREGROUND_SHIFT is not None:
+                        foreground.update(pix, indices)
+                        foreground.update(pix, camera.repaired(), learn=False)
+                        pix = foreground.pix
+                    search.update(pix, indices, camera.subpage)
+                    search.update(pix, camera.repaired())
+                    if current and (
+                            FOREGROUND_SHIFT is None
+                            or foreground.energy >= FOREGROUND_MIN):
+                        if TARGET_COUNT > 1:
+                            found = search.best_blocks()
+                        else:
+                            found = (search.best(),)
+                            if (FOREGROUND_SHIFT is not None
+                                    and found[0][2] < FOREGROUND_MIN):
+                                found = ()
+                    if found:
+                        # Columns are mirrored, as in the CSV output
+                        found = [(row_idx, NUM_COLS - BLOCK_SIZE - col, total)
+                                 for row_idx, col, total in found]
+
+            elif state == ACQ_FRAME:
+                image = camera.take_frame()
+                if FOREGROUND_SHIFT is not None:
+                    # Only the pixels read in this frame are new, and only
+                    # they can show that a target is still there
+                    energy = 0
+                    for indices in camera.frame_indices():
+                        energy += foreground.update(image.pix, indices)
+                    image = foreground.pix
+                if current and (FOREGROUND_SHIFT is None
+                                or energy >= FOREGROUND_MIN):
+                    camera.get_scaled(image, cam_data, limits=(0, 99))
+                    if TARGET_COUNT > 1:
+                        found = search.search_top(cam_data)
+                    else:
+                        found = (search.search(cam_data),)
+                camera.release_frame()
+
+            # The block the camera's window is kept on
+            chosen = found[0] if found else None
+            if found and following:
+                # Follow the target with the nearest block in this image,
+                # which is the best one unless a queued target is followed
+                aim_x, aim_y = tracker.predict()
+                nearest = None
+                for target in found:
+                    dist_x, dist_y = locate_target(searched, target,
+                                                   as_read, aim)
+                    miss = abs(dist_x - aim_x) + abs(dist_y - aim_y)
+                    if nearest is None or miss < nearest:
+                        nearest = miss
+                        near_x, near_y = dist_x, dist_y
+                        chosen = target
+                if not tracker.update(near_x, near_y):
+                    # Not the target followed, so don't keep it in view
+                    chosen = None
+            elif found and not acquired:
+                # Located now, while the image still holds them
+                seen = utime.ticks_ms()
+                targets.put_targets(
+                    locate_target(searched, target, as_read, aim)
+                    + (target[2], seen) for target in found)
+
+            if state == ACQ_FRAME and TRACK_WINDOW is not None:
+                if chosen:
+                    # Back from mirrored columns to those the camera reads
+                    row_idx, col, _ = chosen
+                    camera.track(row_idx + BLOCK_SIZE // 2,
+                                 NUM_COLS - 1 - col - BLOCK_SIZE // 2)
+                else:
+                    # Lost, so read whole frames again
+                    camera.track()
+        else:
+            reading = False
+
+        if following:
+            if tracker.updates >= TRACK_UPDATES:
+                dist_x, dist_y = tracker.predict(
+                    utime.ticks_add(utime.ticks_ms(), AIM_LEAD_MS))
+                target_x_share.put(dist_x)
+                target_y_share.put(dist_y)
+                if not acquired:
+                    targ_acquired_share.put(1)
+                    print("Target acquired.")
+
+        elif not acquired and targets.targets():
+            dist_x, dist_y, _, seen = targets.get_target()
+            if tracker is not None:
+                # Followed from where and when it was seen, so the time it
+                # waited in the queue doesn't count as time it took to move
+                # to where it is next found
+                tracker.reset()
+                tracker.update(dist_x, dist_y, timestamp=seen)
+            else:
+                target_x_share.put(dist_x)
+                target_y_share.put(dist_y)
+                targ_acquired_share.put(1)
+                print("Target acquired.")
 
         yield 0
 
@@ -101,7 +366,8 @@ def motor_pitch_task2(shares):
         objects, and also initializes a proportional controller object. If a 
         target has been acquired and the pitch has not yet reached the target,
         the motor will rotate into position. Once the pitch has reached its 
-        target, a 1 is written to the 'at_pitch' share and the motor is disbled.
+        target, a 1 is written to the 'at_pitch' share and the motor is disbled
+        until the next target is acquired.
         @param  shares  This task requires access to the 'target_x,' 
                 'targ_acquired,' 'pitch_curr', and 'at_pitch' shares.
         """
@@ -116,10 +382,11 @@ def motor_pitch_task2(shares):
         if targ_acquired_share.get() & (not at_pitch_share.get()):
             setpoint = target_y_share.get()
             controller.set_setpoint(setpoint)
+            motor_dvr.enable()
             motor_dvr.set_duty_cycle(
                 controller.run(setpoint, encoder.read())
             )
-            yaw_curr_share.put(
+            pitch_curr_share.put(
                 controller.motor_positions[len(controller.motor_positions) - 1]
             )
 
@@ -138,7 +405,8 @@ def motor_yaw_task3(shares):
         is started for the first time, the yaw motor will rotate 180 degrees. If ]
         a target has been acquired and the yaw has not yet reached the target, 
         the motor will rotate into position. Once the yaw has reached its 
-        target, a 1 is written to the 'at_yaw' share and the motor is disbled.
+        target, a 1 is written to the 'at_yaw' share and the motor is disbled
+        until the next target is acquired.
         @param  shares  This task requires access to the 'start,' 'target_y,' 
                 'targ_acquired,' 'yaw_curr', and 'at_yaw' shares.
         """
@@ -168,10 +436,11 @@ def motor_yaw_task3(shares):
         if targ_acquired_share.get() & (not at_yaw_share.get()):
             setpoint = target_x_share.get()
             controller.set_setpoint(setpoint)
+            motor_dvr.enable()
             motor_dvr.set_duty_cycle(
                 controller.run(setpoint, encoder.read())
             )
-            pitch_curr_share.put(
+            yaw_curr_share.put(
                 controller.motor_positions[len(controller.motor_positions) - 1]
             )
 
@@ -190,7 +459,9 @@ def shoot_task4(shares):
         has been acquired and both pitch and yaw motors are positioned 
         appropriately, the internal motor will turn on the solonoid will extend
         after a 0.2 second delay. Then, after another 0.5 second delay, the nerf 
-        motor is turned off and the solonoid plunger is retracted.
+        motor is turned off and the solonoid plunger is retracted. The 
+        'targ_acquired,' 'at_yaw' and 'at_pitch' flags are then cleared, so
+        the next target is acquired and aimed at.
         @param  shares  This task requires access to the 'targ_acquired,' 
                 'at_yaw', and 'at_pitch' shares.
         """
@@ -199,14 +470,22 @@ def shoot_task4(shares):
     nerf_motor_pin = pyb.Pin(pyb.Pin.board.PC2, pyb.Pin.OUT_PP)
     solenoid_pin = pyb.Pin(pyb.Pin.board.PC3, pyb.Pin.OUT_PP)
 
-    if targ_acquired_share.get() & at_yaw_share.get() & at_pitch_share.get():
-        nerf_motor_pin.high()
-        utime.sleep_ms(200)
-        solenoid_pin.high()
-        utime.sleep_ms(500)
-        nerf_motor_pin.low()
-        solenoid_pin.low()
-        print("Shot fired.")
+    while True:
+        if (targ_acquired_share.get() & at_yaw_share.get()
+                & at_pitch_share.get()):
+            nerf_motor_pin.high()
+            utime.sleep_ms(200)
+            solenoid_pin.high()
+            utime.sleep_ms(500)
+            nerf_motor_pin.low()
+            solenoid_pin.low()
+            print("Shot fired.")
+
+            at_yaw_share.put(0)
+            at_pitch_share.put(0)
+            targ_acquired_share.put(0)
+
+        yield 0
 
 
 if __name__ == "__main__":
@@ -216,24 +495,11 @@ if __name__ == "__main__":
     targ_acquired_share = task_share.Share('b', name="targ_acquired")
     yaw_curr_share = task_share.Share('f', name="yaw_curr")
     pitch_curr_share = task_share.Share('f', name="pitch_curr")
-    at_yaw_share = task_share.Share('b', name="nerf_motor")
-    at_pitch_share = task_share.Share('b', name="solenoid")
+    at_yaw_share = task_share.Share('b', name="at_yaw")
+    at_pitch_share = task_share.Share('b', name="at_pitch")
     nerf_motor_share = task_share.Share('b', name="nerf_motor")
     solenoid_share = task_share.Share('b', name="solenoid")
 
-    shares = [
-              start_share, 
-              target_x_share, 
-              target_y_share, 
-              targ_acquired_share,
-              yaw_curr_share, 
-              at_yaw_share,
-              pitch_curr_share, 
-              at_pitch_share,
-              nerf_motor_share, 
-              solenoid_share
-              ]
-
     start_share.put(1)
     target_x_share.put(0)
     target_y_share.put(0)
@@ -246,16 +512,22 @@ if __name__ == "__main__":
     solenoid_share.put(0)
 
     t1_get_target = cotask.Task(
-        get_target_task1, name="Task1", priority=1, period=20, shares=shares
+        get_target_task1, name="Task1", priority=1, period=20,
+        shares=(target_x_share, target_y_share, targ_acquired_share)
         )
     t2_motor_yaw = cotask.Task(
-        motor_pitch_task2, name="Task2", priority=2, period=10, shares=shares
+        motor_pitch_task2, name="Task2", priority=2, period=10,
+        shares=(target_y_share, targ_acquired_share, pitch_curr_share,
+                at_pitch_share)
         )
     t3_motor_pitch = cotask.Task(
-        motor_yaw_task3, name="Task3", priority=2, period=10, shares=shares
+        motor_yaw_task3, name="Task3", priority=2, period=10,
+        shares=(start_share, target_x_share, targ_acquired_share,
+                yaw_curr_share, at_yaw_share)
         )
     t4_shoot = cotask.Task(
-        shoot_task4, name="Task4", priority=3, period=50, shares=shares
+        shoot_task4, name="Task4", priority=3, period=50,
+        shares=(targ_acquired_share, at_yaw_share, at_pitch_share)
         )
 
     cotask.task_list.append(t1_get_target)
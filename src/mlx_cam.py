@@ -25,12 +25,21 @@ example.
 """
 
 import utime as time
-from machine import Pin, I2C
 from mlx_raw.mlx90640 import MLX90640
 from mlx_raw.mlx90640.calibration import NUM_ROWS, NUM_COLS, IMAGE_SIZE, TEMP_K
 from mlx_raw.mlx90640.image import ChessPattern, InterleavedPattern
 
 
+## Yielded by @c MLX_Cam.acquire() while waiting for or reading camera data
+ACQ_BUSY = const(0)
+
+## Yielded by @c MLX_Cam.acquire() when a subpage has just been read
+ACQ_SUBPAGE = const(1)
+
+## Yielded by @c MLX_Cam.acquire() when a subpage completes a full frame
+ACQ_FRAME = const(2)
+
+
 class MLX_Cam:
     """!
     @brief   Class which wraps an MLX90640 thermal infrared camera driver to
@@ -38,7 +47,8 @@ class MLX_Cam:
     """
 
     def __init__(self, i2c, address=0x33, pattern=ChessPattern,
-                 width=NUM_COLS, height=NUM_ROWS):
+                 width=NUM_COLS, height=NUM_ROWS, frames=1, repair=True,
+                 stats=True, window=None, full_every=8):
         """!
         @brief   Set up an MLX90640 camera.
         @param   i2c An I2C bus which has been set up to talk to the camera;
@@ -48,6 +58,21 @@ class MLX_Cam:
                  the pixels at a time (default ChessPattern)
         @param   width The width of the image in pixels; leave it at default
         @param   height The height of the image in pixels; leave it at default
+        @param   frames The number of preallocated images into which frames
+                 are read in turn by @c acquire(). With two or more, a frame
+                 taken with @c take_frame() stays untouched while the next
+                 one is read; with one (the default) the image is reused
+        @param   repair If @c True (the default), pixels which the camera's
+                 EEPROM marks as failed or as outliers are replaced in every
+                 subpage read by an average of their neighbours
+        @param   stats If @c True (the default), the minimum, maximum and so
+                 on of each frame are gathered while it is read, so that
+                 showing it doesn't need extra passes over the pixels
+        @param   window A tuple @c (rows, columns) giving the size of the
+                 window read around a target passed to @c track(), or
+                 @c None (the default) to always read whole frames
+        @param   full_every While tracking, a whole frame is read after this
+                 many windowed frames, so a new target elsewhere can be seen
         """
         ## The I2C bus to which the camera is attached
         self._i2c = i2c
@@ -63,10 +88,35 @@ class MLX_Cam:
         # The MLX90640 object that does the work
         self._camera = MLX90640(i2c, address)
         self._camera.set_pattern(pattern)
-        self._camera.setup()
+        self._camera.setup(frames=frames, stats=stats)
+        if repair:
+            self._camera.load_bad_pixels()
+        if window is not None:
+            self._camera.set_window(*window, full_every=full_every)
+
+        ## The subpage most recently read by @c acquire(), or @c None
+        self.subpage = None
+
+        # The image into which that subpage was read
+        self._sp_image = None
+
+        # The pixels of a whole frame, as returned by frame_indices()
+        self._whole = (range(width * height),)
+
 
-        ## A local reference to the image object within the camera driver
-        self._image = self._camera.raw
+    @staticmethod
+    def _limits(array):
+        """!
+        @brief   Find the smallest and largest values in an image.
+        @details The statistics gathered while a raw image was read are used
+                 if there are any; other arrays are searched.
+        @param   array A @c RawImage or an array of pixel values
+        @returns A tuple @c (minimum, maximum)
+        """
+        stats = getattr(array, 'stats', None)
+        if stats is not None and stats.count:
+            return stats.min, stats.max
+        return min(array), max(array)
 
 
     def ascii_image(self, array, pixel="██", textcolor="0;180;0"):
@@ -101,8 +151,8 @@ class MLX_Cam:
                  letter representing the intensity of red, green, and blue from
                  0 to 255
         """
-        minny = min(array)
-        scale = 255.0 / (max(array) - minny)
+        minny, maxy = self._limits(array)
+        scale = 255.0 / (maxy - minny)
         for row in range(self._height):
             for col in range(self._width):
                 pix = int((array[row * self._width + (self._width - col - 1)]
@@ -123,8 +173,9 @@ class MLX_Cam:
                  by a bad pixel in the camera. 
         @param   array The array to be shown, probably @c image.v_ir
         """
-        scale = len(MLX_Cam.asc) / (max(array) - min(array))
-        offset = -min(array)
+        minny, maxy = self._limits(array)
+        scale = len(MLX_Cam.asc) / (maxy - minny)
+        offset = -minny
         for row in range(self._height):
             line = ""
             for col in range(self._width):
@@ -150,8 +201,9 @@ class MLX_Cam:
                  to which the data should be scaled, or @c None for no scaling
         """
         if limits and len(limits) == 2:
-            scale = (limits[1] - limits[0]) / (max(array) - min(array))
-            offset = limits[0] - min(array)
+            minny, maxy = self._limits(array)
+            scale = (limits[1] - limits[0]) / (maxy - minny)
+            offset = limits[0] - minny
         else:
             offset = 0.0
             scale = 1.0
@@ -167,6 +219,39 @@ class MLX_Cam:
         return
 
 
+    def get_scaled(self, array, out, limits=None):
+        """!
+        @brief   Write image data, scaled and mirrored as by @c get_csv(),
+                 into an array supplied by the caller.
+        @details No text is made and nothing is allocated, so a task can use
+                 the same buffer for every frame. The values are those
+                 @c get_csv() would print, stored row by row with the columns
+                 mirrored so that they read as the scene does.
+        @param   array The array of data to be presented, or a @c RawImage
+        @param   out An @c array or @c bytearray of (width * height) items
+                 into which the values are written; it must be able to hold
+                 them, so a @c bytearray needs limits between 0 and 255
+        @param   limits A 2-iterable containing the maximum and minimum values
+                 to which the data should be scaled, or @c None for no scaling
+        @returns The array @c out
+        """
+        if limits and len(limits) == 2:
+            minny, maxy = self._limits(array)
+            scale = (limits[1] - limits[0]) / (maxy - minny)
+            offset = limits[0] - minny
+        else:
+            offset = 0.0
+            scale = 1.0
+        pix = getattr(array, 'pix', array)
+        width = self._width
+        for row in range(self._height):
+            base = row * width
+            last = base + width - 1
+            for col in range(width):
+                out[base + col] = int((pix[last - col] + offset) * scale)
+        return out
+
+
     def get_image(self):
         """!
         @brief   Get one image from a MLX90640 camera.
@@ -187,11 +272,146 @@ class MLX_Cam:
         return image
 
 
+    def acquire(self):
+        """!
+        @brief   Read images from the camera without blocking other tasks.
+        @details This generator is a state machine meant to be run a step at
+                 a time from a @c cotask task, for example by calling
+                 @c next() on it once each time the task runs. It yields
+                 @c ACQ_BUSY while waiting for the camera to have data and
+                 after each I2C transfer of a subpage, so no step takes more
+                 than a few milliseconds. When a subpage has been read into
+                 @c image() it yields @c ACQ_SUBPAGE, with the subpage number
+                 in @c subpage. Once both subpages of a frame are in, the
+                 frame is given a sequence number and time stamp and becomes
+                 available from @c take_frame(), and @c ACQ_FRAME is yielded.
+        """
+        while True:
+            while not self._camera.has_data:
+                yield ACQ_BUSY
+
+            self.subpage = self._camera.last_subpage
+            self._sp_image = self._camera.raw
+            for _ in self._camera.iter_read_image(self.subpage):
+                yield ACQ_BUSY
+
+            if self._camera.raw.subpages == 0b11:
+                self._camera.publish_frame()
+                yield ACQ_FRAME
+            else:
+                yield ACQ_SUBPAGE
+
+
+    def image(self):
+        """!
+        @brief   Get the image object into which @c acquire() is reading.
+        @details With more than one frame buffer this image may be only
+                 partly filled; use @c take_frame() to get complete frames.
+        @returns A reference to the camera driver's current image object
+        """
+        return self._camera.raw
+
+
+    def last_subpage(self):
+        """!
+        @brief   Get the pixels of the subpage most recently read by
+                 @c acquire().
+        @details This lets a consumer update its results with only the half
+                 of the pixels which changed, as soon as each subpage
+                 arrives, instead of waiting for whole frames.
+        @returns A tuple @c (image, indices) holding the image into which the
+                 subpage was read and an array of the indices of its pixels
+        """
+        return self._sp_image, self._camera.last_read.sp_range()
+
+
+    def track(self, row=None, col=None):
+        """!
+        @brief   Read only a window around a target from the next frame on.
+        @details Both subpages of each frame are read from a window of the
+                 size given to the constructor, centred on the target, which
+                 takes a fraction of the I2C time of a whole frame. The rest
+                 of each image keeps older data. Every @c full_every frames a
+                 whole frame is read anyway. Call this again as the target
+                 moves, or with no target when it has been lost, to go back
+                 to reading whole frames; a target outside the window of a
+                 windowed frame also counts as lost. It does nothing unless
+                 the camera was made with a @c window.
+        @param   row The row of the target's pixel in the image as read,
+                 that is with columns not mirrored, or @c None if lost
+        @param   col The column of the target's pixel in the image as read
+        """
+        self._camera.track(row, col)
+
+
+    @property
+    def windowed(self):
+        """!
+        @brief   @c True if the frame being read covers only the window
+                 around a tracked target.
+        """
+        return self._camera.windowed
+
+
+    def frame_indices(self):
+        """!
+        @brief   Get the indices of the pixels read in the newest frame.
+        @details After a windowed frame the rest of the image holds pixels
+                 from earlier frames, so a consumer which learns from each
+                 frame should only take up the pixels read in it. Call this
+                 before @c acquire() starts the next frame.
+        @returns A tuple of index sequences which together cover the pixels
+                 read: those of the window in each subpage if the frame was
+                 windowed, otherwise the whole image
+        """
+        if self._camera.windowed:
+            window = self._camera.window
+            return window.sp_range(0), window.sp_range(1)
+        return self._whole
+
+
+    def repaired(self):
+        """!
+        @brief   Get the indices of the pixels replaced in each subpage read.
+        @details A repaired pixel takes its value from neighbours in either
+                 subpage, so a consumer updating its results from
+                 @c last_subpage() should treat these pixels as changed too.
+        @returns An array of pixel indices, empty if nothing is repaired
+        """
+        plan = self._camera.bad_pixels
+        return plan.targets if plan is not None else ()
+
+
+    def take_frame(self, after_seq=0):
+        """!
+        @brief   Get the newest complete frame read by @c acquire().
+        @details The frame is not copied. It belongs to the caller, and won't
+                 be overwritten by @c acquire(), until the next call to this
+                 method or to @c release_frame(). The frame's @c seq attribute
+                 holds its sequence number and @c timestamp holds the
+                 @c ticks_ms() time at which it was completed.
+        @param   after_seq Only return a frame whose sequence number is
+                 greater than this, such as that of the last frame used
+        @returns The newest complete frame, or @c None if there isn't a new
+                 one
+        """
+        return self._camera.ring.take(after_seq)
+
+
+    def release_frame(self):
+        """!
+        @brief   Let @c acquire() reuse the frame from @c take_frame().
+        """
+        self._camera.ring.release()
+
+
 # The test code sets up the sensor, then grabs and shows an image in a terminal
 # every ten and a half seconds or so.
 ## @cond NO_DOXY don't document the test code in the driver documentation
 if __name__ == "__main__":
 
+    from machine import Pin, I2C
+
     # The following import is only used to check if we have an STM32 board such
     # as a Pyboard or Nucleo; if not, use a different library
     try:
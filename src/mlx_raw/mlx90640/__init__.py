@@ -7,6 +7,7 @@ This version is a stripped down MLX90640 driver which produces only raw data,
 not calibrated data, in order to save memory.
 """
 
+import utime as time
 from gc import collect, mem_free
 from ucollections import namedtuple
 from mlx90640.regmap import (
@@ -14,12 +15,29 @@ from mlx90640.regmap import (
     EEPROM_MAP,
     RegisterMap,
     CameraInterface,
+    EepromImage,
     REG_SIZE,
     EEPROM_ADDRESS,
     EEPROM_SIZE,
+    VOLATILE_REGISTERS,
+    STATE_BLOCKS,
 )
 # from mlx90640.calibration import CameraCalibration, TEMP_K
-from mlx90640.image import RawImage, Subpage, get_pattern_by_id
+from mlx90640.calibration import (
+    CameraCalibration,
+    PixelCalibrationData,
+    IMAGE_SIZE,
+    TEMP_K,
+)
+from mlx90640.image import (
+    RawImage,
+    FrameRing,
+    ProcessedImage,
+    BadPixelPlan,
+    ReadWindow,
+    Subpage,
+    get_pattern_by_id,
+)
 
 
 class CameraDetectError(Exception):
@@ -62,6 +80,48 @@ CameraState = namedtuple('CameraState',
                          ('vdd', 'ta', 'ta_r', 'gain', 'gain_cp'))
 
 
+class StateCache:
+    """!
+    The camera state last read, served from memory in place of reading it
+    for every subpage. Ambient temperature, supply voltage and gain change
+    slowly, so the state is read again only once @c refresh_ms have passed,
+    unless the last refresh found it drifting by more than a threshold, in
+    which case it is read every time until it settles.
+    """
+
+    def __init__(self, refresh_ms=1000, ta_drift=0.1, vdd_drift=0.01):
+        """!
+        @param   refresh_ms The time between refreshes of a steady state
+        @param   ta_drift The change in ambient temperature, in degrees C,
+                 between refreshes above which the state counts as drifting
+        @param   vdd_drift The same for the supply voltage, in volts
+        """
+        self.refresh_ms = refresh_ms
+        self.ta_drift = ta_drift
+        self.vdd_drift = vdd_drift
+        ## The @c CameraState last read, or @c None
+        self.state = None
+        ## The @c ticks_ms() time at which it was read
+        self.timestamp = 0
+        ## How many times the state has been read
+        self.refreshes = 0
+        self.drifting = False
+
+    def due(self, now):
+        # whether the state should be read again at time now
+        return (self.state is None or self.drifting
+                or time.ticks_diff(now, self.timestamp) >= self.refresh_ms)
+
+    def update(self, state, now):
+        old = self.state
+        self.drifting = old is not None and (
+            abs(state.ta - old.ta) > self.ta_drift
+            or abs(state.vdd - old.vdd) > self.vdd_drift)
+        self.state = state
+        self.timestamp = now
+        self.refreshes += 1
+
+
 class DataNotAvailableError(Exception):
     pass
 
@@ -72,29 +132,157 @@ class MLX90640:
         """!
         """
         self.iface = CameraInterface(i2c, addr)
-        self.registers = RegisterMap(self.iface, REGISTER_MAP)
-        self.eeprom = RegisterMap(self.iface, EEPROM_MAP, readonly=True)
+        self.registers = RegisterMap(self.iface, REGISTER_MAP, cache=True,
+                                     volatile=VOLATILE_REGISTERS)
+        self.eeprom = RegisterMap(self.iface, EEPROM_MAP, readonly=True,
+                                  cache=True)
         self.calib = None
         self.raw = None
-#         self.image = None
+        self.ring = None
+        self.image = None
+        self.bad_pixels = None
+        self.state_cache = None
         self.last_read = None
-
-
-    def setup(self, *, calib=None, raw=None, image=None):
+        ## The @c ReadWindow read in place of whole frames while tracking,
+        #  or @c None
+        self.window = None
+        ## @c True if the frame being read is limited to @c window
+        self.windowed = False
+        self.full_every = 0
+        self._track = None
+        self._windowed_frames = 0
+
+
+    def setup(self, *, calib=None, raw=None, image=None, frames=1,
+              stats=False):
         """!
+        @param   calib Calibration data, if already loaded; a @c ProcessedImage
+                 is then made for it unless @c image is given
+        @param   frames The number of images in the frame ring; with more than
+                 one, each complete frame can be handed to a consumer while
+                 the next is read into another image
+        @param   stats If @c True, each image of the frame ring gathers
+                 @c FrameStats as its pixels are decoded
         """
         # We've been having some memory allocation errors which usually happen
         # as this method runs. As a workaround, run gc.collect() several times
         # to keep memory cleaned up, as when the process is finished, there is
         # a bunch of free memory (~27KB or more on STM32L476) available
 #         collect()
-#         self.calib = calib or CameraCalibration(self.iface, self.eeprom)
+#         self.calib = calib or CameraCalibration(self.read_eeprom(), self.eeprom)
         collect()
 #         print(f"setup: {mem_free()}", end='')
-        self.raw = raw or RawImage()
+        self.ring = FrameRing(frames, raw, stats=stats)
+        self.raw = self.ring.writing
         collect()
 #         print(f" -> {mem_free()}")
-#         self.image = image or ProcessedImage(self.calib)
+        self.calib = calib
+        if image is None and calib is not None:
+            image = ProcessedImage(calib)
+        self.image = image
+
+
+    def read_eeprom(self):
+        """!
+        Copy the whole EEPROM into memory in a few bursts. From then on the
+        calibration fields in @c self.eeprom are parsed from that copy, and
+        the returned image can be given to the calibration code in place of
+        the camera interface.
+        @returns The new @c EepromImage
+        """
+        image = EepromImage(self.iface)
+        self.eeprom = RegisterMap(image, EEPROM_MAP, readonly=True)
+        return image
+
+
+    def load_calibration(self, cache_path=None, **kwargs):
+        """!
+        Build the calibration data from an in-memory copy of the EEPROM, and
+        the @c ProcessedImage which turns raw subpages into temperatures with
+        @c process_image(). The raw driver doesn't do this in @c setup() to
+        save memory. Every calibration stage is built here, after which the
+        EEPROM copy is let go.
+        @param   cache_path A file in which the derived calibration is kept
+                 between boots; it is rebuilt only if the EEPROM contents
+                 differ from those the file was made from
+        @param   kwargs Options passed on to @c CameraCalibration
+        @returns The new @c CameraCalibration object, also kept in
+                 @c self.calib
+        """
+        image = self.read_eeprom()
+        self.calib = CameraCalibration(image, self.eeprom,
+                                       cache_path=cache_path, **kwargs)
+        self.calib.build()
+        self.image = ProcessedImage(self.calib)
+
+        # every stage is built, so the EEPROM copy can go; the few fields
+        # still wanted are read from the camera
+        del image
+        self.eeprom = RegisterMap(self.iface, EEPROM_MAP, readonly=True,
+                                  cache=True)
+        collect()
+        return self.calib
+
+
+    def load_bad_pixels(self):
+        """!
+        Make the plan by which pixels marked in the EEPROM as failed or as
+        outliers are repaired in every subpage read and every processed
+        image. Without calibration loaded, the pixel words are read from the
+        camera for the purpose and then let go.
+        @returns The new @c BadPixelPlan, also kept in @c self.bad_pixels
+        """
+        if self.calib is not None:
+            bad = self.calib.failed + self.calib.outliers
+        else:
+            pix_data = PixelCalibrationData(self.iface)
+            bad = pix_data.failed + pix_data.outliers
+            del pix_data
+        self.bad_pixels = BadPixelPlan(bad)
+
+        # bad pixels are also left out of frame statistics
+        skip = bytearray(IMAGE_SIZE)
+        for idx in bad:
+            skip[idx] = 1
+        for frame in self.ring.frames if self.ring is not None else ():
+            if frame.stats is not None:
+                frame.stats.skip = skip
+        collect()
+        return self.bad_pixels
+
+
+    def set_window(self, height=10, width=10, full_every=8):
+        """!
+        Allow frames to be read from a window around a tracked target, in
+        both subpages, rather than from the whole image. Nothing changes
+        until @c track() is given a target.
+        @param   height The number of rows of pixels in the window
+        @param   width The number of columns of pixels in the window
+        @param   full_every After this many windowed frames, a whole frame is
+                 read so that the rest of the image is kept up to date; zero
+                 reads windows only
+        @returns The new @c ReadWindow, also kept in @c self.window
+        """
+        self.window = ReadWindow(self.get_pattern(), height, width)
+        self.full_every = full_every
+        return self.window
+
+
+    def track(self, row=None, col=None):
+        """!
+        Centre the read window on a target from the next frame on, or go back
+        to reading whole frames if the target has been lost. A target found
+        outside the window of a windowed frame is taken as lost, as the
+        pixels there are out of date. A frame already begun is finished as it
+        was started, so both of its subpages cover the same pixels.
+        @param   row The row of the target's pixel, or @c None if it is lost
+        @param   col The column of the target's pixel
+        """
+        if (row is None or self.window is None
+                or self.windowed and not self.window.contains(row, col)):
+            self._track = None
+        else:
+            self._track = (row, col)
 
 
     @property
@@ -124,59 +312,69 @@ class MLX90640:
 
     def read_vdd(self):
         """!
-        Turned off to save memory for raw driver version.
+        Without calibration data, as in the raw driver, this is a placeholder.
         """
         # supply voltage calculation (delta Vdd)
         # type: (self) -> float
         vdd_pix = self.registers['vdd_pix'] * self._adc_res_corr()
-#         return float(vdd_pix - self.calib.vdd_25)/self.calib.k_vdd
-        return float(vdd_pix)
+        if self.calib is None:
+            return float(vdd_pix)
+        return float(vdd_pix - self.calib.vdd_25)/self.calib.k_vdd
 
 
     def _adc_res_corr(self):
         """!
-        Turned off to save memory for raw driver version.
+        Without calibration data, as in the raw driver, this is a placeholder.
         """
         # type: (self) -> float
-#         res_exp = self.calib.res_ee - self.registers['adc_resolution']
-#         return 1 << res_exp
-        return 0
+        if self.calib is None:
+            return 0
+        res_exp = self.calib.res_ee - self.registers['adc_resolution']
+        return 1 << res_exp if res_exp >= 0 else 1.0/(1 << -res_exp)
 
 
     def read_ta(self):
         """!
-        Turned off to save memory for raw driver version.
+        Without calibration data, as in the raw driver, this is a placeholder.
         """
         # ambient temperature calculation (delta Ta in degC)
         # type: (self) -> float
+        if self.calib is None:
+            return 0.0
         v_ptat = self.registers['ta_ptat']
         v_be = self.registers['ta_vbe']
-#         v_ptat_art = v_ptat/(v_ptat*self.calib.alpha_ptat + v_be) * 262144
-# 
-#         v_ta = v_ptat_art/(1.0 + self.calib.kv_ptat*self.read_vdd() - self.calib.ptat_25)
+        v_ptat_art = v_ptat/(v_ptat*self.calib.alpha_ptat + v_be) * 262144
+
+        v_ta = v_ptat_art/(1.0 + self.calib.kv_ptat*self.read_vdd()) - self.calib.ptat_25
 
         # print('v_ptat: ', v_ptat)
         # print('v_be:', v_be)
         # print('v_ptat_art: ', v_ptat_art)
 
-#         return v_ta/self.calib.kt_ptat
-        return 0.0
+        return v_ta/self.calib.kt_ptat
 
 
     def read_gain(self):
         """!
-        Turned off to save memory for raw driver version.
+        Without calibration data, as in the raw driver, this is a placeholder.
         """
         # gain calculation
         # type: (self) -> float
-#         return self.calib.gain / self.registers['gain']
-        return float(self.registers['gain'])
+        if self.calib is None:
+            return float(self.registers['gain'])
+        return self.calib.gain / self.registers['gain']
 
 
     # tr - temperature of reflected environment
     def read_state(self, *, tr=None):
         """!
+        Read everything needed to compensate an image. The RAM words involved
+        are fetched in the short runs of @c STATE_BLOCKS and each value is
+        decoded from the register cache, so the state costs four
+        transactions per frame.
         """
+        self.prefetch_state()
+
         gain = self.read_gain()
         cp_sp_0 = gain * self.registers['cp_sp_0']
         cp_sp_1 = gain * self.registers['cp_sp_1']
@@ -184,13 +382,13 @@ class MLX90640:
         ta = self.read_ta()
 
         ta_abs = ta + 25
-#         if self.calib.emissivity == 1:
-        ta_r = (ta_abs + TEMP_K)**4
-#         else:
-#             tr = tr if tr is not None else ta_abs - 8
-#             ta_k4 = (ta_abs + TEMP_K)**4
-#             tr_k4 = (tr + TEMP_K)**4
-#             ta_r = tr_k4 - (tr_k4 - ta_k4)/self.calib.emissivity
+        if self.calib is None or self.calib.emissivity == 1:
+            ta_r = (ta_abs + TEMP_K)**4
+        else:
+            tr = tr if tr is not None else ta_abs - 8
+            ta_k4 = (ta_abs + TEMP_K)**4
+            tr_k4 = (tr + TEMP_K)**4
+            ta_r = tr_k4 - (tr_k4 - ta_k4)/self.calib.emissivity
 
         return CameraState(
             vdd = self.read_vdd(),
@@ -201,11 +399,49 @@ class MLX90640:
         )
 
 
+    def cache_state(self, refresh_ms=1000, **kwargs):
+        """!
+        Serve the camera state from memory in @c get_state(), reading it
+        from the camera only now and then.
+        @param   refresh_ms The time between reads of a steady state
+        @param   kwargs Drift thresholds passed on to @c StateCache
+        @returns The new @c StateCache, also kept in @c self.state_cache
+        """
+        self.state_cache = StateCache(refresh_ms, **kwargs)
+        return self.state_cache
+
+
+    def get_state(self, *, tr=None):
+        """!
+        Get the camera state: from the cache if @c cache_state() has been
+        called and the cached state is still fresh, else by @c read_state().
+        """
+        cache = self.state_cache
+        if cache is None:
+            return self.read_state(tr=tr)
+        now = time.ticks_ms()
+        if cache.due(now):
+            cache.update(self.read_state(tr=tr), now)
+        return cache.state
+
+
+    def prefetch_state(self):
+        """!
+        Read the RAM runs holding the camera state words into the register
+        cache unless they are already there for the current frame.
+        """
+        for address, count in STATE_BLOCKS:
+            self.registers.prefetch(address, count)
+
+
     @property
     def has_data(self):
         """!
-        Report whether there's data available from the camera.
+        Report whether there's data available from the camera. Each check
+        starts a new register snapshot, so the status and RAM words are read
+        at most once for the frame which follows.
         """
+        self.registers.refresh()
         return bool(self.registers['data_available'])
 
 
@@ -219,36 +455,92 @@ class MLX90640:
     def read_image(self, sp_id = None):
         """!
         """
+        for _ in self.iter_read_image(sp_id):
+            pass
+        return self.raw
+
+
+    def iter_read_image(self, sp_id = None):
+        """!
+        A generator which does the work of @c read_image() a piece at a time,
+        yielding after each I2C transaction so that a cooperative task can
+        read a subpage without holding the CPU for the whole transfer.
+        """
         if not self.has_data:
             raise DataNotAvailableError
 
         if sp_id is None:
             sp_id = self.last_subpage
 
-        subpage = Subpage(self.get_pattern(), sp_id)
+        # a frame begins with its first subpage, or with one which comes
+        # round again before the frame was finished
+        new_frame = not self.raw.subpages or self.raw.subpages & 1 << sp_id
+        if new_frame:
+            self._start_frame()
+
+        subpage = Subpage(self.get_pattern(), sp_id,
+                          self.window if self.windowed else None)
         self.last_read = subpage
 
+        # statistics start afresh with each frame
+        stats = self.raw.stats
+        if stats is not None and new_frame:
+            stats.reset()
+
         # print(f"read SP {subpage.id}")
-        self.raw.read(self.iface, subpage.sp_range())
+        yield from self.raw.iter_read(self.iface, subpage.sp_range())
+        if stats is not None and self.windowed:
+            # they would cover only the window; with none, users scan the frame
+            stats.reset()
+        if self.bad_pixels is not None:
+            self.bad_pixels.apply(self.raw.pix)
+        self.raw.subpages |= 1 << sp_id
         self.registers['data_available'] = 0
-        return self.raw
 
 
-#     def process_image(self, sp_id = None, state = None):
-#         """!
-#         """
-#         if self.last_read is None:
-#             raise DataNotAvailableError
-# 
-#         subpage = self.last_read
-#         if sp_id is not None:
-#             subpage.id = sp_id
-# 
-#         state = state or self.read_state()
-# 
-#         # print(f"process SP {subpage.id}")
-#         raw_data = ((idx, self.raw[idx]) for idx in subpage.sp_range())
-#         self.image.update(raw_data, subpage, state)
-#         return self.image
+    def _start_frame(self):
+        # choose between the window and the whole image for a new frame
+        if self._track is None or (
+                self.full_every and self._windowed_frames >= self.full_every):
+            self.windowed = False
+            self._windowed_frames = 0
+        else:
+            self.window.move(*self._track)
+            self.windowed = True
+            self._windowed_frames += 1
+
+
+    def publish_frame(self):
+        """!
+        Stamp the image being read with the next sequence number and the time,
+        make it the newest complete frame in the ring, and move on to reading
+        into another image.
+        @returns The frame just published
+        """
+        frame = self.ring.publish(time.ticks_ms())
+        self.raw = self.ring.writing
+        return frame
+
+
+    def process_image(self, sp_id = None, state = None, raw = None):
+        """!
+        Convert the subpage last read into temperatures in @c self.image,
+        which needs @c load_calibration() to have been run.
+        @param   raw The image holding the subpage, if not @c self.raw
+        """
+        if self.last_read is None:
+            raise DataNotAvailableError
+
+        subpage = self.last_read
+        if sp_id is not None:
+            subpage.id = sp_id
+
+        state = state or self.get_state()
+
+        # print(f"process SP {subpage.id}")
+        self.image.update(raw or self.raw, subpage, state)
+        if self.bad_pixels is not None:
+            self.bad_pixels.apply(self.image.buf)
+        return self.image
 
 
@@ -1,10 +1,12 @@
+import struct
 from array import array
 from mlx90640.utils import (
     Struct, 
     StructProto,
     field_desc,
+    array_filled,
 )
-from mlx90640.regmap import REG_SIZE
+from mlx90640.regmap import REG_SIZE, EepromImage
 
 NUM_ROWS = const(24)
 NUM_COLS = const(32)
@@ -24,11 +26,11 @@ CC_PROTO = StructProto((
 ))
 
 def _read_cc_iter(iface, base, size):
-    buf = bytearray(REG_SIZE)
-    struct = Struct(buf, CC_PROTO)
+    # all of the packed coefficient words are fetched with one read
+    buf = bytearray(size // 4 * REG_SIZE)
+    iface.read_into(base, buf)
     for addr_off in range(size // 4):
-        cc_addr = base + addr_off
-        iface.read_into(cc_addr, buf)
+        struct = Struct(buf, CC_PROTO, addr_off * REG_SIZE)
         yield struct['0']
         yield struct['1']
         yield struct['2']
@@ -56,35 +58,179 @@ PIX_CALIB_ADDRESS = const(0x2440)
 
 class PixelCalibrationData:
     def __init__(self, iface):
+        # iface may be an EepromImage, in which case its words are used in
+        # place; otherwise the whole table is fetched in one read
         pix_count = NUM_ROWS * NUM_COLS
-        self._data = bytearray(pix_count * REG_SIZE)
-
-        failed = []
-        buf = bytearray(REG_SIZE)
-        for idx in range(pix_count):
-            offset = idx * REG_SIZE
-            iface.read_into(PIX_CALIB_ADDRESS + offset, buf)
-            if buf != bytes(REG_SIZE):
-                self._data[offset:offset+REG_SIZE] = buf
-            else:
-                failed.append(idx)
-        self.failed = tuple(failed)
+        if isinstance(iface, EepromImage):
+            self._data = iface.view(PIX_CALIB_ADDRESS, pix_count)
+        else:
+            self._data = bytearray(pix_count * REG_SIZE)
+            iface.read_into(PIX_CALIB_ADDRESS, self._data)
+
+        # a word of all zeros marks a pixel which failed at the factory, and
+        # the lowest bit one which is out of specification
+        data = self._data
+        self.failed = tuple(
+            idx for idx in range(pix_count)
+            if not (data[idx * REG_SIZE] or data[idx * REG_SIZE + 1])
+        )
+        self.outliers = tuple(
+            idx for idx in range(pix_count)
+            if data[idx * REG_SIZE + 1] & 0x01
+        )
 
     def __len__(self):
         return len(self._data)//REG_SIZE
     def __getitem__(self, idx):
-        offset = idx * REG_SIZE
-        return Struct(self._data[offset:offset+REG_SIZE], PIX_CALIB_PROTO)
+        return Struct(self._data, PIX_CALIB_PROTO, idx * REG_SIZE)
     def __iter__(self):
         for idx in range(len(self)):
             yield self[idx]
 
 TEMP_K = 273.15
 
+def _fixed_point(numerators, exp):
+    # Store the per-pixel values numerator/2**exp as 16-bit numerators, the
+    # way the EEPROM encodes them, sharing one exponent per array. Where the
+    # largest numerator doesn't fit they are all shifted right and the
+    # exponent lowered to match. numerators is called for each of the two
+    # passes, so nothing the size of the array is kept in between.
+    biggest = max(abs(n) for n in numerators())
+    shift = 0
+    while biggest >> shift > 0x7FFF:
+        shift += 1
+    return array('h', (n >> shift for n in numerators())), exp - shift
+
+## Calibration cache files
+# layout: magic, EEPROM key, then length-prefixed JSON holding the scalar
+# constants, length-prefixed outlier and failed pixel lists, and finally the
+# per-pixel arrays in native byte order, read straight into arrays on load
+CACHE_MAGIC = b'MLXC'
+CACHE_VERSION = const(1)
+
+# per-pixel arrays kept in the cache, with their typecodes
+_CACHE_ARRAYS = (
+    ('pix_os_ref', 'h'),
+    ('pix_kta', 'f'),
+    ('pix_alpha', 'f'),
+    ('il_offset', 'f'),
+)
+# attributes kept apart from the JSON scalars, or not at all: options given
+# at run time and the raw pixel words
+_CACHE_SKIP = ('emissivity', 'pix_data', 'outliers', 'failed',
+               '_built', '_iface', '_eeprom') + tuple(
+    name for name, _ in _CACHE_ARRAYS)
+
+## The stages in which a calibration is built, in order, with the attributes
+#  each sets. Stage @c name is run by the method @c _calc_name the first time
+#  one of its attributes is needed, or by @c CameraCalibration.build().
+CALIB_STAGES = (
+    ('state', ('k_vdd', 'vdd_25', 'res_ee', 'kv_ptat', 'kt_ptat', 'ptat_25',
+               'alpha_ptat', 'gain')),
+    ('offset', ('failed', 'outliers', 'pix_os_ref')),
+    ('kta', ('kta_scale_1', 'kta_scale_2', 'pix_kta', 'pix_kta_exp',
+             'kv_scale', 'kv_avg', 'tgc', 'pix_os_cp', 'kta_cp', 'kv_cp')),
+    ('alpha', ('pix_alpha', 'pix_alpha_exp', 'ksta', 'pix_alpha_cp')),
+    ('interleave', ('il_chess_c1', 'il_chess_c2', 'il_chess_c3', 'il_offset',
+                    'il_offset_exp')),
+    ('temperature', ('drift', 'ksto_scale', 'ksto', 'ct', 'alpha_ext')),
+)
+_STAGE_OF = {
+    name: stage for stage, names in CALIB_STAGES for name in names
+}
+# the stages which read the per-pixel EEPROM words
+_PIXEL_STAGES = ('offset', 'kta', 'alpha')
+
+def eeprom_key(image, use_tgc=False, compact=False):
+    # identifies the EEPROM contents and options a calibration was built from;
+    # imported here, as only the cache needs it
+    try:
+        from uhashlib import sha256
+    except ImportError:
+        from hashlib import sha256
+    digest = sha256(image.buf)
+    digest.update(bytes((CACHE_VERSION, int(use_tgc), int(compact))))
+    return digest.digest()
+
+def _as_tuples(value):
+    # JSON gives back lists where the calibration used tuples
+    if isinstance(value, list):
+        return tuple(_as_tuples(item) for item in value)
+    return value
+
 class CameraCalibration:
-    def __init__(self, iface, eeprom, *, emissivity=1, use_tgc=False):
+    def __init__(self, iface, eeprom, *, emissivity=1, use_tgc=False,
+                 cache_path=None, compact=False):
+        # set first, as __getattr__ looks at it
+        self._built = set()
         self.emissivity = emissivity
-
+        # tgc only available for device type 'C'
+        self.use_tgc = use_tgc
+        self.pix_data = None
+
+        # kept until the last stage has been built
+        self._iface = iface
+        self._eeprom = eeprom
+
+        # with compact set, pix_kta, pix_alpha and il_offset are arrays of
+        # 16-bit numerators, each value being numerator/2**exp with exp held
+        # in pix_kta_exp, pix_alpha_exp and il_offset_exp; otherwise they
+        # are float arrays and the exponents are 0
+        self.compact = compact
+
+        # everything derived depends only on the EEPROM, so when it has been
+        # read into an image the results can be kept in a file and reloaded
+        key = None
+        if cache_path is not None and isinstance(iface, EepromImage):
+            key = eeprom_key(iface, use_tgc, compact)
+            if self.load_cache(cache_path, key):
+                return
+
+        if key is not None:
+            self.build()
+            self.save_cache(cache_path, key)
+
+    def __getattr__(self, name):
+        # only called for attributes which aren't set: build the stage which
+        # sets this one, unless it has already run
+        stage = _STAGE_OF.get(name)
+        if stage is None or stage in self._built:
+            raise AttributeError(name)
+        self.build(stage)
+        return getattr(self, name)
+
+    def build(self, *stages):
+        """!
+        Run calibration stages which haven't been run yet. The per-pixel
+        EEPROM words are let go once the stages using them are done, and the
+        EEPROM itself once every stage is.
+        @param   stages Names of stages from @c CALIB_STAGES; all of them if
+                 none are given
+        """
+        for stage, _ in CALIB_STAGES:
+            if stage in self._built or (stages and stage not in stages):
+                continue
+            getattr(self, '_calc_' + stage)(self._iface, self._eeprom)
+            self._built.add(stage)
+
+            if all(s in self._built for s in _PIXEL_STAGES):
+                self.pix_data = None
+            if len(self._built) == len(CALIB_STAGES):
+                self._iface = self._eeprom = None
+
+    @property
+    def complete(self):
+        """!
+        @c True once every stage has been built.
+        """
+        return len(self._built) == len(CALIB_STAGES)
+
+    def _pixel_data(self, iface):
+        if self.pix_data is None:
+            self.pix_data = PixelCalibrationData(iface)
+        return self.pix_data
+
+    def _calc_state(self, iface, eeprom):
         # restore VDD sensor parameters
         self.k_vdd = eeprom['k_vdd'] * 32
         self.vdd_25 = (eeprom['vdd_25'] - 256) * 32 - 8192
@@ -101,15 +247,26 @@ class CameraCalibration:
         # gain
         self.gain = eeprom['gain']
 
+    def _calc_offset(self, iface, eeprom):
         # pixel calibration data
-        self.pix_data = PixelCalibrationData(iface)
+        pix_data = self._pixel_data(iface)
+        self.failed = pix_data.failed
         self.pix_os_ref = array('h', self._calc_pix_os_ref(iface, eeprom))
-        self.outliers = tuple(idx for idx, data in enumerate(self.pix_data) if data['outlier'])
+        self.outliers = pix_data.outliers
 
+    def _calc_kta(self, iface, eeprom):
         # IR data compensation
+        self._pixel_data(iface)
         self.kta_scale_1 = 1 << (eeprom['kta_scale_1'] + 8)
         self.kta_scale_2 = 1 << eeprom['kta_scale_2']
-        self.pix_kta = array('f', self._calc_pix_kta(eeprom))
+        kta_exp = eeprom['kta_scale_1'] + 8
+        if self.compact:
+            self.pix_kta, self.pix_kta_exp = _fixed_point(
+                lambda: self._calc_pix_kta(eeprom), kta_exp)
+        else:
+            self.pix_kta = array('f', (
+                kta/self.kta_scale_1 for kta in self._calc_pix_kta(eeprom)))
+            self.pix_kta_exp = 0
 
         self.kv_scale = 1 << eeprom['kv_scale']
         self.kv_avg = (
@@ -119,12 +276,8 @@ class CameraCalibration:
         )
         
         # IR gradient compensation
-
-        # tgc only available for device type 'C'
-        self.use_tgc = use_tgc
-
-        if use_tgc:
-            self.tgc = eeprom['tgc'] / 32.0 if use_tgc else False
+        if self.use_tgc:
+            self.tgc = eeprom['tgc'] / 32.0 if self.use_tgc else False
 
             offset_cp_sp_0 = eeprom['offset_cp_sp_0']
             offset_cp_sp_1 = offset_cp_sp_0 + eeprom['offset_cp_delta']
@@ -133,23 +286,42 @@ class CameraCalibration:
             self.kta_cp = eeprom['kta_cp'] / self.kta_scale_1
             self.kv_cp = eeprom['kv_cp'] / self.kv_scale
 
+    def _calc_alpha(self, iface, eeprom):
         # sensitivity normalization
-        self.pix_alpha = array('f', self._calc_pix_alpha_ref(iface, eeprom))
+        self._pixel_data(iface)
+        alpha_exp = eeprom['alpha_scale'] + 30
+        if self.compact:
+            self.pix_alpha, self.pix_alpha_exp = _fixed_point(
+                lambda: self._calc_pix_alpha_ref(iface, eeprom), alpha_exp)
+        else:
+            alpha_scale = 1 << alpha_exp
+            self.pix_alpha = array('f', (
+                alpha/alpha_scale
+                for alpha in self._calc_pix_alpha_ref(iface, eeprom)))
+            self.pix_alpha_exp = 0
         self.ksta = eeprom['ksta'] / 8192.0
 
-        if use_tgc:
+        if self.use_tgc:
             alpha_scale_cp = 1 << (eeprom['alpha_scale'] + 27)
             cp_sp_ratio = eeprom['cp_sp_ratio']
             pix_alpha_cp_sp_0 = eeprom['alpha_cp_sp_0'] / alpha_scale_cp
             pix_alpha_cp_sp_1 = pix_alpha_cp_sp_0*(1 + cp_sp_ratio/128.0)
             self.pix_alpha_cp = (pix_alpha_cp_sp_0, pix_alpha_cp_sp_1)
 
+    def _calc_interleave(self, iface, eeprom):
         # interleaved pattern
         self.il_chess_c1 = eeprom['il_chess_c1'] / 16.0
         self.il_chess_c2 = eeprom['il_chess_c2'] / 2.0
         self.il_chess_c3 = eeprom['il_chess_c3'] / 8.0
-        self.il_offset = array('f', self._calc_il_offset())
-
+        if self.compact:
+            # the interleave constants are eighths and halves
+            self.il_offset, self.il_offset_exp = _fixed_point(
+                lambda: (round(il*8) for il in self._calc_il_offset()), 3)
+        else:
+            self.il_offset = array('f', self._calc_il_offset())
+            self.il_offset_exp = 0
+
+    def _calc_temperature(self, iface, eeprom):
         # temperature calculation
         self.drift = 0  # temperature drift correction
 
@@ -173,6 +345,65 @@ class CameraCalibration:
         alpha_4 = alpha_3*(1.0 + ksto3*(ct4 - ct3))
         self.alpha_ext = (alpha_1, alpha_2, alpha_3, alpha_4)
 
+    def save_cache(self, path, key):
+        import json
+        scalars = {
+            name: value for name, value in self.__dict__.items()
+            if name not in _CACHE_SKIP
+        }
+        header = json.dumps(scalars).encode()
+        try:
+            with open(path, 'wb') as file:
+                file.write(CACHE_MAGIC)
+                file.write(key)
+                file.write(struct.pack('<H', len(header)))
+                file.write(header)
+                for pixels in (self.outliers, self.failed):
+                    file.write(struct.pack('<H', len(pixels)))
+                    file.write(array('H', pixels))
+                for name, _ in _CACHE_ARRAYS:
+                    file.write(getattr(self, name))
+        except OSError:
+            # a read-only filesystem only costs us the time saved next boot
+            pass
+
+    def load_cache(self, path, key):
+        # returns False, leaving self alone, unless the file matches the key
+        import json
+        try:
+            with open(path, 'rb') as file:
+                if (file.read(len(CACHE_MAGIC)) != CACHE_MAGIC
+                        or file.read(len(key)) != key):
+                    return False
+                size, = struct.unpack('<H', file.read(2))
+                scalars = json.loads(file.read(size).decode())
+                pixels = []
+                for _ in range(2):
+                    count, = struct.unpack('<H', file.read(2))
+                    pix = array_filled('H', count)
+                    file.readinto(pix)
+                    pixels.append(tuple(pix))
+                arrays = []
+                for name, typecode in _CACHE_ARRAYS:
+                    if self.compact:
+                        typecode = 'h'
+                    arr = array_filled(typecode, NUM_ROWS * NUM_COLS)
+                    if file.readinto(arr) != len(arr) * struct.calcsize(typecode):
+                        return False
+                    arrays.append(arr)
+        except (OSError, ValueError):
+            return False
+
+        for name, value in scalars.items():
+            setattr(self, name, _as_tuples(value))
+        self.outliers, self.failed = pixels
+        for (name, _), arr in zip(_CACHE_ARRAYS, arrays):
+            setattr(self, name, arr)
+        self.pix_data = None
+        self._built = set(stage for stage, _ in CALIB_STAGES)
+        self._iface = self._eeprom = None
+        return True
+
     def _calc_pix_os_ref(self, iface, eeprom):
         offset_avg = eeprom['pix_os_average']
         occ_scale_row = 1 << eeprom['scale_occ_row']
@@ -193,8 +424,8 @@ class CameraCalibration:
                 )
 
     def _calc_pix_alpha_ref(self, iface, eeprom):
+        # yields each pixel's alpha times 2**(alpha_scale + 30)
         alpha_ref = eeprom['pix_sensitivity_average']
-        alpha_scale = 1 << (eeprom['alpha_scale'] + 30)
         acc_scale_row = 1 << eeprom['scale_acc_row']
         acc_scale_col = 1 << eeprom['scale_acc_col']
         acc_scale_rem = 1 << eeprom['scale_acc_rem']
@@ -210,9 +441,10 @@ class CameraCalibration:
                     + acc_rows[row] * acc_scale_row
                     + acc_cols[col] * acc_scale_col
                     + self.pix_data[idx]['alpha'] * acc_scale_rem
-                ) / alpha_scale
+                )
 
     def _calc_pix_kta(self, eeprom):
+        # yields each pixel's kta times kta_scale_1
         # index by [row % 2][col % 2]
         kta_avg = (
             (eeprom['kta_avg_re_ce'], eeprom['kta_avg_re_co']),
@@ -224,7 +456,7 @@ class CameraCalibration:
                 idx = row * NUM_COLS + col
                 kta_ee = self.pix_data[idx]['kta']
                 kta_rc = kta_avg[row % 2][col % 2]
-                yield (kta_rc + kta_ee * self.kta_scale_2)/self.kta_scale_1
+                yield kta_rc + kta_ee * self.kta_scale_2
 
     def _calc_il_offset(self):
         for idx in range(NUM_ROWS*NUM_COLS):
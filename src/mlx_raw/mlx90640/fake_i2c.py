@@ -0,0 +1,119 @@
+"""!
+@file fake_i2c.py
+This file contains a stand-in for @c machine.I2C which serves MLX90640 memory
+from a dictionary and counts bus traffic, so that driver changes can be
+benchmarked on a host (such as the MicroPython Unix port) with no camera.
+"""
+
+import utime as time
+
+## Bits clocked per byte on the bus: 8 data bits and an acknowledge
+_BITS_PER_BYTE = const(9)
+
+## Bytes of overhead in a 16-bit-addressed memory read: the device address
+#  for writing, two memory address bytes, then the device address for reading
+_READ_OVERHEAD = const(4)
+
+## Address of the camera status register, which can be made to announce
+#  new subpages as a running camera would
+_STATUS_ADDRESS = const(0x8000)
+
+
+class FakeI2C:
+    """!
+    A fake I2C bus holding one MLX90640, addressed by 16-bit word as the real
+    camera is. Every read or write counts as one transaction.
+    """
+
+    def __init__(self, addr=0x33, words=None, *, freq=400_000, xfer_us=50,
+                 frame_us=None, realtime=False):
+        """!
+        @param   addr The address at which the fake camera answers
+        @param   words A dictionary of @c { word @c address : value } used
+                 to initialize the camera memory; unset words read as zero
+        @param   freq The bus clock frequency in Hz used for time estimates
+        @param   xfer_us A rough guess at the fixed cost of each transaction
+                 in microseconds: the MicroPython call, start and stop
+                 conditions, and the bus turnaround
+        @param   frame_us If given, the fake camera flags a new subpage in
+                 the status register this often, alternating subpages
+        @param   realtime If @c True, each transaction waits for as long as
+                 it would take on a real bus
+        """
+        self.addr = addr
+        self.mem = dict(words) if words else {}
+        self.freq = freq
+        self.xfer_us = xfer_us
+        self.frame_us = frame_us
+        self.realtime = realtime
+        self._frame_time = time.ticks_us()
+        self._subpage = 1
+        self.reset_counts()
+
+    def reset_counts(self):
+        self.transactions = 0
+        self.bytes_read = 0
+        self.bytes_written = 0
+
+    def bus_time_us(self):
+        """!
+        Estimate how long the counted traffic would take on a real bus.
+        """
+        nbytes = (self.transactions * _READ_OVERHEAD
+                  + self.bytes_read + self.bytes_written)
+        return (nbytes * _BITS_PER_BYTE * 1_000_000 // self.freq
+                + self.transactions * self.xfer_us)
+
+    def _transaction(self, nbytes):
+        # count one transaction, and take as long as it would if asked to
+        self.transactions += 1
+        if self.realtime:
+            time.sleep_us((_READ_OVERHEAD + nbytes) * _BITS_PER_BYTE
+                          * 1_000_000 // self.freq + self.xfer_us)
+
+    def _update_status(self):
+        # flag a new subpage if a frame period has passed since the last one
+        if self.frame_us is None:
+            return
+        now = time.ticks_us()
+        if time.ticks_diff(now, self._frame_time) >= self.frame_us:
+            self._frame_time = now
+            self._subpage ^= 1
+            status = self.mem.get(_STATUS_ADDRESS, 0) & ~0x000F
+            self.mem[_STATUS_ADDRESS] = status | 0x0008 | self._subpage
+
+    def fill(self, base, values):
+        # store consecutive words starting at a word address
+        for offset, value in enumerate(values):
+            self.mem[base + offset] = value & 0xFFFF
+
+    ## machine.I2C interface
+
+    def scan(self):
+        return [self.addr]
+
+    def readfrom_mem(self, addr, memaddr, nbytes, *, addrsize=8):
+        buf = bytearray(nbytes)
+        self.readfrom_mem_into(addr, memaddr, buf, addrsize=addrsize)
+        return bytes(buf)
+
+    def readfrom_mem_into(self, addr, memaddr, buf, *, addrsize=8):
+        self._check_addr(addr)
+        self._update_status()
+        self._transaction(len(buf))
+        self.bytes_read += len(buf)
+        for offset in range(len(buf) // 2):
+            word = self.mem.get(memaddr + offset, 0)
+            buf[2*offset] = word >> 8
+            buf[2*offset + 1] = word & 0xFF
+
+    def writeto_mem(self, addr, memaddr, buf, *, addrsize=8):
+        self._check_addr(addr)
+        self._transaction(len(buf))
+        self.bytes_written += len(buf)
+        for offset in range(len(buf) // 2):
+            self.mem[memaddr + offset] = buf[2*offset] << 8 | buf[2*offset + 1]
+
+    def _check_addr(self, addr):
+        if addr != self.addr:
+            raise OSError(f"no device at address {addr}")
@@ -4,8 +4,8 @@ This file contains image storage and processing classes for the MLX90640 camera
 driver.
 
 RAW VERSION
-This version is a stripped down MLX90640 driver which produces only raw data,
-not calibrated data, in order to save memory.
+This version is a stripped down MLX90640 driver which produces raw data, and
+produces calibrated temperatures only when asked to, in order to save memory.
 """
 
 import math
@@ -20,18 +20,29 @@ from mlx90640.utils import (
 )
 
 from mlx90640.regmap import REG_SIZE
-from mlx90640.calibration import NUM_COLS, IMAGE_SIZE, TEMP_K
+from mlx90640.calibration import NUM_ROWS, NUM_COLS, IMAGE_SIZE, TEMP_K
 
 PIX_STRUCT_FMT = '>h'
 PIX_DATA_ADDRESS = const(0x0400)
 
+# pixel index tables of each pattern's subpages, built when first needed
+_SP_TABLES = {}
+
 class _BasePattern:
     @classmethod
     def sp_range(cls, sp_id):
-        return (
-            idx for idx, sp in enumerate(cls.iter_sp()) 
-            if sp == sp_id
-        )
+        # a read-only array of the pixel indices in a subpage, in order;
+        # it is worked out once, as walking the whole image each time is slow
+        tables = _SP_TABLES.get(cls.pattern_id)
+        if tables is None:
+            tables = _SP_TABLES[cls.pattern_id] = tuple(
+                array('H', (
+                    idx for idx, sp in enumerate(cls.iter_sp())
+                    if sp == sp_id
+                ))
+                for sp_id in (0, 1)
+            )
+        return tables[sp_id]
 
     @classmethod
     def iter_sp(cls):
@@ -62,157 +73,572 @@ def get_pattern_by_id(pattern_id):
 
 
 class Subpage:
-    def __init__(self, pattern, sp_id):
+    def __init__(self, pattern, sp_id, window=None):
         self.pattern = pattern
         self.id = sp_id
+        # a ReadWindow to which reading and processing are limited, or None
+        self.window = window
 
     def sp_range(self):
+        if self.window is not None:
+            return self.window.sp_range(self.id)
         return self.pattern.sp_range(self.id)
 
 
+class ReadWindow:
+    """!
+    A rectangle of pixels which is read in place of the whole image, such as
+    the area around a target being tracked. The indices of its pixels in
+    each subpage are kept in arrays allocated once, and refilled whenever
+    the window is moved.
+    """
+
+    def __init__(self, pattern, height=10, width=10):
+        """!
+        @param   pattern The pattern by which pixels are split into subpages
+        @param   height The number of rows in the window
+        @param   width The number of columns in the window
+        """
+        self.pattern = pattern
+        self.height = min(height, NUM_ROWS)
+        self.width = min(width, NUM_COLS)
+        ## The row and column of the window's top left pixel
+        self.top = 0
+        self.left = 0
+        size = self.height * self.width
+        self._indices = (array_filled('H', size), array_filled('H', size))
+        self._views = tuple(memoryview(ind) for ind in self._indices)
+        self._counts = [0, 0]
+        self.move(0, 0)
+
+    def move(self, row, col):
+        """!
+        Centre the window on a pixel, as nearly as it can be while staying
+        inside the image.
+        """
+        top = min(max(row - self.height // 2, 0), NUM_ROWS - self.height)
+        left = min(max(col - self.width // 2, 0), NUM_COLS - self.width)
+        self.top, self.left = top, left
+
+        counts = self._counts
+        counts[0] = counts[1] = 0
+        get_sp = self.pattern.get_sp
+        for row in range(top, top + self.height):
+            base = row * NUM_COLS
+            for idx in range(base + left, base + left + self.width):
+                sp_id = get_sp(idx)
+                self._indices[sp_id][counts[sp_id]] = idx
+                counts[sp_id] += 1
+
+    def contains(self, row, col):
+        return (self.top <= row < self.top + self.height
+                and self.left <= col < self.left + self.width)
+
+    def sp_range(self, sp_id):
+        # the indices of the window's pixels in a subpage, in order
+        return self._views[sp_id][:self._counts[sp_id]]
+
+
 ## Image Buffers
 
+## Largest gap, in words, between wanted pixels which a bulk read will read
+#  through rather than starting a new I2C transaction
+RUN_MAX_GAP = const(2)
+## Most words fetched by one bulk read transaction (two image rows)
+RUN_MAX_WORDS = const(64)
+
+## Default lowest value, bin width (as a power of two) and number of bins of
+#  the coarse histogram in @c FrameStats, covering raw values -2048 to 2047
+HIST_LO = const(-2048)
+HIST_SHIFT = const(8)
+HIST_BINS = const(16)
+
+class FrameStats:
+    """!
+    Statistics of the pixels decoded into a @c RawImage since its frame
+    began, gathered as each pixel is decoded so that nothing has to scan the
+    image again to find them. Values below or above the histogram's range
+    are counted in its first or last bin. Pixels marked in @c skip, such as
+    bad ones which are repaired afterwards, are left out.
+    """
+
+    def __init__(self, hist_lo=HIST_LO, hist_shift=HIST_SHIFT,
+                 bins=HIST_BINS):
+        self.hist_lo = hist_lo
+        self.hist_shift = hist_shift
+        ## The number of pixels in each bin of @c 1 << hist_shift values
+        self.hist = array_filled('H', bins)
+        ## A bytearray holding a nonzero value for each pixel to leave out,
+        #  or @c None
+        self.skip = None
+        self.reset()
+
+    def reset(self):
+        self.min = 0x7FFF
+        self.max = -0x8000
+        self.min_idx = -1
+        self.max_idx = -1
+        self.total = 0
+        self.count = 0
+        hist = self.hist
+        for b in range(len(hist)):
+            hist[b] = 0
+
+    def add(self, idx, value):
+        # fold in one pixel; RawImage does the same inline for bulk reads
+        if self.skip is not None and self.skip[idx]:
+            return
+        self.total += value
+        self.count += 1
+        if value < self.min:
+            self.min, self.min_idx = value, idx
+        if value > self.max:
+            self.max, self.max_idx = value, idx
+        b = (value - self.hist_lo) >> self.hist_shift
+        last_bin = len(self.hist) - 1
+        self.hist[0 if b < 0 else (b if b < last_bin else last_bin)] += 1
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def limits(self):
+        return ImageLimits(self.min, self.max, self.min_idx, self.max_idx)
+
 class RawImage:
-    def __init__(self):
+    def __init__(self, bulk=True, stats=False):
         self.pix = array_filled('h', IMAGE_SIZE)
+        self.bulk = bulk
+        ## A @c FrameStats kept up to date as pixels are decoded, if asked for
+        self.stats = FrameStats() if stats else None
+        # frame bookkeeping: bit n of subpages is set once subpage n has been
+        # read; seq and timestamp (ticks_ms) are set when the frame completes
+        self.subpages = 0
+        self.seq = 0
+        self.timestamp = 0
+        # scratch space for bulk reads: the bus buffer and the pixel indices
+        # waiting to be decoded from it
+        self._buf = bytearray(RUN_MAX_WORDS * REG_SIZE)
+        self._view = memoryview(self._buf)
+        self._pending = array_filled('H', RUN_MAX_WORDS)
 
     def __getitem__(self, idx):
         return self.pix[idx]
 
-    def read(self, iface, update_idx = None):
+    def read(self, iface, update_idx = None, bulk = None):
+        for _ in self.iter_read(iface, update_idx, bulk):
+            pass
+
+    def iter_read(self, iface, update_idx = None, bulk = None):
+        # generator version of read() which yields after every transaction,
+        # so a cooperative task can give up the CPU part way through an image
+        if update_idx is None:
+            update_idx = range(IMAGE_SIZE)
+        if bulk is None:
+            bulk = self.bulk
+        if bulk:
+            yield from self._iter_bulk(iface, update_idx)
+            return
+
         buf = bytearray(REG_SIZE)
-        update_idx = update_idx or range(IMAGE_SIZE)
         for offset in update_idx:
             iface.read_into(PIX_DATA_ADDRESS + offset, buf)
             self.pix[offset] = struct.unpack(PIX_STRUCT_FMT, buf)[0]
+            if self.stats is not None:
+                self.stats.add(offset, self.pix[offset])
+            yield
+
+    def _iter_bulk(self, iface, update_idx):
+        # group ascending indices into runs of nearly contiguous addresses,
+        # each of which is fetched with a single transaction
+        pending = self._pending
+        count = 0
+        start = 0
+        for idx in update_idx:
+            if count and (idx - pending[count - 1] > RUN_MAX_GAP + 1
+                          or idx - start >= RUN_MAX_WORDS):
+                self._read_run(iface, start, count)
+                yield
+                count = 0
+            if not count:
+                start = idx
+            pending[count] = idx
+            count += 1
+        if count:
+            self._read_run(iface, start, count)
+            yield
+
+    def _read_run(self, iface, start, count):
+        pending = self._pending
+        size = pending[count - 1] - start + 1
+        iface.read_into(PIX_DATA_ADDRESS + start, self._view[:size * REG_SIZE])
+
+        # decode big-endian words straight into the pixel array
+        buf = self._buf
+        pix = self.pix
+        stats = self.stats
+        if stats is None:
+            for i in range(count):
+                idx = pending[i]
+                offset = (idx - start) * REG_SIZE
+                value = buf[offset] << 8 | buf[offset + 1]
+                pix[idx] = value - 0x10000 if value & 0x8000 else value
+            return
+
+        # the same, folding each pixel into the frame statistics on the way
+        skip = stats.skip
+        hist = stats.hist
+        last_bin = len(hist) - 1
+        hist_lo = stats.hist_lo
+        shift = stats.hist_shift
+        lo, hi = stats.min, stats.max
+        total = stats.total
+        added = 0
+        for i in range(count):
+            idx = pending[i]
+            offset = (idx - start) * REG_SIZE
+            value = buf[offset] << 8 | buf[offset + 1]
+            if value & 0x8000:
+                value -= 0x10000
+            pix[idx] = value
+            if skip is not None and skip[idx]:
+                continue
+            total += value
+            added += 1
+            if value < lo:
+                lo = value
+                stats.min_idx = idx
+            if value > hi:
+                hi = value
+                stats.max_idx = idx
+            b = (value - hist_lo) >> shift
+            hist[0 if b < 0 else (b if b < last_bin else last_bin)] += 1
+        stats.min, stats.max = lo, hi
+        stats.total = total
+        stats.count += added
+
+
+class FrameRing:
+    # A fixed set of preallocated images. The camera reads into the writing
+    # slot; when a frame is complete it is published with a sequence number
+    # and the camera moves on to a slot which is neither the newest frame nor
+    # one held by a consumer, so frames are handed over without copying and
+    # are never changed while in use. With one slot the single image is just
+    # overwritten in place, as it always was.
+    def __init__(self, size=2, first=None, stats=False):
+        self.frames = tuple(
+            first if i == 0 and first is not None else RawImage(stats=stats)
+            for i in range(size)
+        )
+        self.seq = 0
+        self._write = 0
+        self._latest = None
+        self._held = None
+
+    @property
+    def writing(self):
+        return self.frames[self._write]
+
+    @property
+    def latest(self):
+        # the newest complete frame, or None
+        if self._latest is None:
+            return None
+        return self.frames[self._latest]
+
+    def publish(self, timestamp):
+        frame = self.writing
+        self.seq += 1
+        frame.seq = self.seq
+        frame.timestamp = timestamp
+        self._latest = self._write
+
+        size = len(self.frames)
+        for step in range(1, size):
+            slot = (self._write + step) % size
+            if slot != self._held:
+                break
+        else:
+            # nowhere else to write: overwrite the newest frame in place,
+            # withdrawing it if a consumer could otherwise take it half-done
+            slot = self._write
+            if size > 1:
+                self._latest = None
+        self._write = slot
+        self.writing.subpages = 0
+        return frame
+
+    def take(self, after_seq=0):
+        # hand the newest complete frame newer than after_seq to a consumer,
+        # which may use it until the next take() or release(); else None
+        self._held = None
+        frame = self.latest
+        if frame is None or frame.seq <= after_seq:
+            return None
+        self._held = self._latest
+        return frame
+
+    def release(self):
+        self._held = None
 
 
 ImageLimits = namedtuple('ScaleLimits', ('min_h', 'max_h', 'min_idx', 'max_idx'))
 
-_INTERP_NEIGHBOURS = tuple(
-    row * NUM_COLS + col
-    for row in (-1, 0, 1)
-    for col in (-1, 0, 1)
-    if row != 0 or col != 0
+## Offsets of the pixels used to repair a bad one, as (row, column, weight);
+#  the nearer orthogonal neighbours count twice as much as the diagonal ones
+_INTERP_NEIGHBOURS = (
+    (-1, -1, 1), (-1, 0, 2), (-1, 1, 1),
+    (0, -1, 2),              (0, 1, 2),
+    (1, -1, 1),  (1, 0, 2),  (1, 1, 1),
 )
 
-# class ProcessedImage:
-#     def __init__(self, calib):
-#         # pix_data should be a sequence of ints
-#         self.calib = calib
-#         self.v_ir = array_filled('f', IMAGE_SIZE, 0.0)
-#         self.alpha = array_filled('f', IMAGE_SIZE, 1.0)
-#         self.buf = array_filled('f', IMAGE_SIZE, 1.0)
-# 
-#     def update(self, pix_data, subpage, state):
-#         if self.calib.use_tgc:
-#             pix_os_cp = self._calc_os_cp(subpage, state)
-#             pix_alpha_cp = self.calib.pix_alpha_cp[subpage.id]
-# 
-#         for idx, raw in pix_data:
-#             ## IR data compensation - offset, Vdd, and Ta
-#             kta = self.calib.pix_kta[idx]
-# 
-#             row, col = divmod(idx, NUM_COLS)
-#             kv = self.calib.kv_avg[row % 2][col % 2]
-#             
-#             offset = self.calib.pix_os_ref[idx]
-#             offset *= (1 + kta*state.ta)*(1 + kv*state.vdd)
-# 
-#             v_os = raw*state.gain - offset
-#             if subpage.pattern is InterleavedPattern:
-#                 v_os += self.calib.il_offset[idx]
-#             v_ir = v_os / self.calib.emissivity
-# 
-#             ## IR data gradient compensation
-#             if self.calib.use_tgc:
-#                 v_ir -= self.calib.tgc*pix_os_cp
-# 
-#             # preserve v_ir for temperature calculations
-#             self.v_ir[idx] = v_ir
-# 
-#             alpha = self._calc_alpha(idx, state.ta)
-#             self.buf[idx] = v_ir/alpha
-# 
-#     def _calc_os_cp(self, subpage, state):
-#         pix_os_cp = self.calib.pix_os_cp[subpage.id]
-#         if subpage.pattern is InterleavedPattern:
-#             pix_os_cp += self.calib.il_chess_c1
-#         return state.gain_cp[subpage.id] - pix_os_cp*(1 + self.calib.kta_cp*state.ta)*(1 + self.calib.kv_cp*state.vdd)
-# 
-#     def _calc_os_cp2(self, pattern, state):
-#         pix_os_cp = list(self.calib.pix_os_cp)
-#         if pattern is InterleavedPattern:
-#             for i in range(len(pix_os_cp)):
-#                 pix_os_cp[i] += self.calib.il_chess_c1
-# 
-#         k = (1 + self.calib.kta_cp*state.ta)*(1 + self.calib.kv_cp*state.vdd)
-#         return [
-#             gain_cp_sp - pix_os_cp_sp*k
-#             for pix_os_cp_sp, gain_cp_sp in zip(pix_os_cp, state.gain_cp)
-#         ]
-# 
-#     def _calc_alpha(self, idx, ta):
-#         alpha = self.calib.pix_alpha[idx]
-#         if self.calib.use_tgc:
-#             alpha -= self.calib.tgc*pix_alpha_cp
-#         alpha *= (1 + self.calib.ksta*ta)
-#         return alpha
-# 
-#     def _calc_to(self, idx, alpha, ta_r):
-#         v_ir = self.v_ir[idx]
-# 
-#         s_x = v_ir*(alpha**3) + ta_r*(alpha**4)
-#         s_x = math.sqrt(math.sqrt(s_x))*self.calib.ksto[1]
-# 
-#         to = v_ir/(alpha*(1 - TEMP_K*self.calib.ksto[1]) + s_x) + ta_r
-#         to = math.sqrt(math.sqrt(to)) - TEMP_K
-#         return to + self.calib.drift
-# 
-#     def calc_temperature(self, idx, state):
-#         alpha = self._calc_alpha(idx, state.ta)
-#         return self._calc_to(idx, alpha, state.ta_r)
-# 
-#     def calc_temperature_ext(self, idx, state):
-#         v_ir = self.v_ir[idx]
-#         alpha = self._calc_alpha(idx, state.ta)
-#         to = self._calc_to(idx, alpha, state.ta_r)
-# 
-#         band = self._get_range_band(to)
-#         if band < 0:
-#             return self.calib.ct[0]
-# 
-#         alpha_ext = self.calib.alpha_ext[band]
-#         ksto_ext = self.calib.ksto[band]
-#         ct = self.calib.ct[band]
-#         to_ext = v_ir/(alpha*alpha_ext*(1 + ksto_ext*(to - ct))) + state.ta_r
-#         to_ext = math.sqrt(math.sqrt(to_ext)) - TEMP_K
-#         return to_ext  + self.calib.drift
-# 
-#     def _get_range_band(self, t):
-#         return sum(1 for ct in self.calib.ct if t >= ct) - 1
-# 
-#     def calc_limits(self, *, exclude_idx=()):
-#         # find min/max in place to keep mem usage down
-#         min_h, min_idx = None, None
-#         max_h, max_idx = None, None
-#         for idx, h in enumerate(self.buf):
-#             if idx in exclude_idx:
-#                 continue
-#             if min_h is None or h < min_h:
-#                 min_h, min_idx = h, idx
-#             if max_h is None or h > max_h:
-#                 max_h, max_idx = h, idx
-#         return ImageLimits(min_h, max_h, min_idx, max_idx)
-# 
-#     def interpolate_bad_pixels(self, bad_pixels):
-#         for bad_idx in bad_pixels:
-#             count = 0
-#             total = 0
-#             for offset in _INTERP_NEIGHBOURS:
-#                 idx = bad_idx + offset
-#                 if idx in range(IMAGE_SIZE) and idx not in bad_pixels:
-#                     count += 1
-#                     total += self.buf[idx]
-#             if count > 0:
-#                 self.buf[bad_idx] = total/count
+class BadPixelPlan:
+    """!
+    A plan for replacing the pixels which the camera's calibration marks as
+    failed or as outliers with a weighted average of their good neighbours.
+
+    Everything which doesn't change from frame to frame, which neighbours lie
+    in the image (without wrapping from one row's end to the next) and
+    aren't bad themselves, and their weights, is worked out once, so the
+    repair of each frame is a short loop over a few small arrays. It works
+    on raw frames as well as temperatures, so that a dead pixel can't draw
+    the aim of a search for the hottest spot.
+    """
+
+    def __init__(self, bad_pixels, rows=NUM_ROWS, cols=NUM_COLS):
+        """!
+        @param   bad_pixels The indices of the pixels to be repaired
+        @param   rows The number of rows of pixels in an image
+        @param   cols The number of columns of pixels in an image
+        """
+        bad = set(bad_pixels)
+        targets = []
+        starts = [0]
+        neighbours = []
+        weights = []
+        for bad_idx in sorted(bad):
+            row, col = divmod(bad_idx, cols)
+            for d_row, d_col, weight in _INTERP_NEIGHBOURS:
+                n_row, n_col = row + d_row, col + d_col
+                idx = n_row * cols + n_col
+                if (0 <= n_row < rows and 0 <= n_col < cols
+                        and idx not in bad):
+                    neighbours.append(idx)
+                    weights.append(weight)
+            # a pixel with no good neighbours is left as it is
+            if len(neighbours) > starts[-1]:
+                targets.append(bad_idx)
+                starts.append(len(neighbours))
+
+        ## The indices of the pixels which are repaired
+        self.targets = array('H', targets)
+        # the neighbours of targets[n] are neighbours[starts[n]:starts[n + 1]]
+        self._starts = array('H', starts)
+        self._neighbours = array('H', neighbours)
+        self._weights = bytearray(weights)
+        self._totals = array('H', (sum(weights[starts[n]:starts[n + 1]])
+                                   for n in range(len(targets))))
+
+    def __len__(self):
+        return len(self.targets)
+
+    def apply(self, buf):
+        """!
+        Repair the bad pixels in an image.
+        @param   buf A flat array of pixel values, such as @c RawImage.pix or
+                 @c ProcessedImage.buf; integer values are rounded
+        """
+        if not self.targets:
+            return
+        starts = self._starts
+        neighbours = self._neighbours
+        weights = self._weights
+        totals = self._totals
+        is_float = isinstance(buf[0], float)
+
+        for n, bad_idx in enumerate(self.targets):
+            total = 0
+            for k in range(starts[n], starts[n + 1]):
+                total += buf[neighbours[k]]*weights[k]
+            if is_float:
+                buf[bad_idx] = total/totals[n]
+            else:
+                buf[bad_idx] = (total + totals[n]//2)//totals[n]
+
+
+class ProcessedImage:
+    """!
+    Object temperatures, in degrees C, computed from raw subpages.
+
+    All the compensation steps of the datasheet are done in one pass over the
+    pixels of a subpage, writing nothing but the finished temperature. The
+    parts of each step which don't change from frame to frame are folded into
+    per-pixel arrays here, and the parts which are the same for every pixel
+    of a subpage are worked out once per call to @c update(). Besides the
+    calibration, this costs two float arrays: @c buf and @c _os_kta.
+
+    With a compact calibration, whose coefficients are 16-bit fixed point,
+    the offset, Vdd and Ta compensation is done in integers, and @c _os_kta
+    isn't needed. Floats take over from the emissivity step on. The integers
+    are scaled by the largest power of two, up to 2**16, for which the
+    biggest any of them could be, given the calibration and the state, is
+    below 2**30. They are then small ints, which MicroPython handles
+    without allocating.
+    """
+
+    def __init__(self, calib, *, extended=False):
+        """!
+        @param   calib The @c CameraCalibration of the camera
+        @param   extended If @c True, temperatures below 0 C or above the
+                 third band temperature are corrected with the constants of
+                 their band, as the datasheet does for its extended range
+        """
+        self.calib = calib
+        ## The temperature of each pixel
+        self.buf = array_filled('f', IMAGE_SIZE, 0.0)
+        self.extended = extended
+
+        # offset*(1 + kta*ta) is split into offset + (offset*kta)*ta, so the
+        # offset array is shared with the calibration and only its product
+        # with kta needs memory of its own
+        self._os = calib.pix_os_ref
+        if calib.compact:
+            self._os_kta = None
+            # the largest numerators, which bound the integers in update()
+            self._os_max = max(abs(n) for n in self._os)
+            self._kta_max = max(abs(n) for n in calib.pix_kta)
+            self._il_max = max(abs(n) for n in calib.il_offset)
+        else:
+            kta = calib.pix_kta
+            self._os_kta = array('f', self._os)
+            for idx in range(IMAGE_SIZE):
+                self._os_kta[idx] *= kta[idx]
+
+        # kv is indexed by ((row % 2) << 1) | (col % 2)
+        self._kv = calib.kv_avg[0] + calib.kv_avg[1]
+
+    def update(self, raw, subpage, state):
+        """!
+        Compute the temperatures of the pixels in one subpage.
+        @param   raw The @c RawImage holding the subpage
+        @param   subpage The @c Subpage read
+        @param   state The @c CameraState at the time it was read
+        """
+        calib = self.calib
+        pix = raw.pix
+        buf = self.buf
+        pix_os = self._os
+        os_kta = self._os_kta
+        pix_alpha = calib.pix_alpha
+
+        ## per-frame factors
+        ta = state.ta
+        gain = state.gain
+        ta_r = state.ta_r
+        kv = tuple(1 + k*state.vdd for k in self._kv)
+        il_offset = (calib.il_offset if subpage.pattern is InterleavedPattern
+                     else None)
+        inv_emissivity = 1.0/calib.emissivity
+
+        if calib.use_tgc:
+            v_cp = calib.tgc*self._calc_os_cp(subpage, state)
+            alpha_cp = calib.tgc*calib.pix_alpha_cp[subpage.id]
+        else:
+            v_cp = 0.0
+            alpha_cp = 0.0
+        alpha_k = 1 + calib.ksta*ta
+
+        compact = calib.compact
+        if compact:
+            # kv*vdd in units of 2**-16, and kta*ta and the gain in units of
+            # 2**-q; Ta is taken in 1/256 degrees so that kta*ta is an
+            # integer before shifting. Raw pixels are 16 bits, so the
+            # largest v_ir is 0x8000*gain_q + os_max*k_max + il_max, and q
+            # is lowered until that and the other products are small ints
+            kta = calib.pix_kta
+            kv_q = tuple(round(k*state.vdd*0x10000) for k in self._kv)
+            kv_max = max(abs(k) for k in kv_q)
+            small = 0x40000000
+            q = 16
+            while True:
+                ta_q = round(ta*256)
+                kta_shift = calib.pix_kta_exp + 8 - q
+                if kta_shift < 0:
+                    ta_q <<= -kta_shift
+                    kta_shift = 0
+                kta_ta_max = self._kta_max*abs(ta_q)
+                k_max = (1 << q) + (kta_ta_max >> kta_shift) + 1
+                k_max += (k_max*kv_max >> 16) + 1
+                gain_q = round(gain*(1 << q))
+                il_shift = q - calib.il_offset_exp
+                il_max = (self._il_max << il_shift if il_shift >= 0
+                          else self._il_max >> -il_shift)
+                if q == 0 or (kta_ta_max < small and k_max*kv_max < small
+                              and 0x8000*abs(gain_q) + self._os_max*k_max
+                              + il_max < small):
+                    break
+                q -= 1
+            unit = 1 << q
+            v_scale = inv_emissivity/unit
+            alpha_scale = alpha_k/(1 << calib.pix_alpha_exp)
+            alpha_cp *= alpha_k
+
+        ksto = calib.ksto[1]
+        k_ksto = 1 - TEMP_K*ksto
+        t_offset = calib.drift - TEMP_K
+        extended = self.extended
+
+        for idx in subpage.sp_range():
+            ## IR data compensation - offset, Vdd, and Ta
+            if compact:
+                k = unit + (kta[idx]*ta_q >> kta_shift)
+                k += k*kv_q[(idx >> 4 & 2) | (idx & 1)] >> 16
+                v_ir = pix[idx]*gain_q - pix_os[idx]*k
+                if il_offset is not None:
+                    if il_shift >= 0:
+                        v_ir += il_offset[idx] << il_shift
+                    else:
+                        v_ir += il_offset[idx] >> -il_shift
+                v_ir = v_ir*v_scale - v_cp
+                alpha = pix_alpha[idx]*alpha_scale - alpha_cp
+            else:
+                offset = (pix_os[idx] + os_kta[idx]*ta)*kv[(idx >> 4 & 2) | (idx & 1)]
+                v_ir = pix[idx]*gain - offset
+                if il_offset is not None:
+                    v_ir += il_offset[idx]
+                v_ir = v_ir*inv_emissivity - v_cp
+                alpha = (pix_alpha[idx] - alpha_cp)*alpha_k
+
+            ## object temperature
+            alpha_2 = alpha*alpha
+            s_x = alpha_2*alpha*(v_ir + alpha*ta_r)
+            s_x = math.sqrt(math.sqrt(s_x))*ksto if s_x > 0 else 0.0
+
+            to = v_ir/(alpha*k_ksto + s_x) + ta_r
+            to = (math.sqrt(math.sqrt(to)) if to > 0 else 0.0) + t_offset
+
+            if extended:
+                band = self._get_range_band(to)
+                if band != 1:
+                    to = self._calc_to_ext(v_ir, alpha, to, band, ta_r)
+            buf[idx] = to
+
+    def _calc_os_cp(self, subpage, state):
+        pix_os_cp = self.calib.pix_os_cp[subpage.id]
+        if subpage.pattern is InterleavedPattern:
+            pix_os_cp += self.calib.il_chess_c1
+        return state.gain_cp[subpage.id] - pix_os_cp*(1 + self.calib.kta_cp*state.ta)*(1 + self.calib.kv_cp*state.vdd)
+
+    def _calc_to_ext(self, v_ir, alpha, to, band, ta_r):
+        if band < 0:
+            return self.calib.ct[0]
+
+        alpha_ext = self.calib.alpha_ext[band]
+        ksto_ext = self.calib.ksto[band]
+        ct = self.calib.ct[band]
+        to_ext = v_ir/(alpha*alpha_ext*(1 + ksto_ext*(to - ct))) + ta_r
+        to_ext = math.sqrt(math.sqrt(to_ext)) if to_ext > 0 else 0.0
+        return to_ext - TEMP_K + self.calib.drift
+
+    def _get_range_band(self, t):
+        return sum(1 for ct in self.calib.ct if t >= ct) - 1
@@ -49,10 +49,23 @@ REGISTER_MAP = {
     0x072A : field_desc('vdd_pix',      FD_WORD, signed=True),
 }
 
+# Registers which the camera changes by itself, so a cached copy is only good
+# until the next frame; the rest are changed only by us and can be kept
+VOLATILE_REGISTERS = (0x8000, 0x0700, 0x0708, 0x070A, 0x0720, 0x0728, 0x072A)
+
+# RAM runs of (address, word count) holding every word needed for the camera
+# state. Words up to two apart share a run, as reading through a short gap
+# costs less than a transaction; longer gaps start a new run, so the six
+# words take four transactions of 16 bytes rather than 22 words in two
+STATE_BLOCKS = ((0x0700, 1), (0x0708, 3), (0x0720, 1), (0x0728, 3))
+
 # Calibration Data
 EEPROM_ADDRESS = const(0x2400)
 EEPROM_SIZE    = const(0x340)
 
+# Words per transaction when copying the whole EEPROM into memory
+EEPROM_BURST_WORDS = const(0xD0)
+
 # From table on page 21
 EEPROM_MAP = {
     0x2410 : (
@@ -154,12 +167,61 @@ class CameraInterface:
 
 class ReadOnlyError(Exception): pass
 
+class EepromImage:
+    # A copy of the EEPROM read in a few bursts. It has the same read methods
+    # as CameraInterface, so a RegisterMap or the calibration code can parse
+    # fields from memory instead of the bus
+    def __init__(self, iface, base=EEPROM_ADDRESS, size=EEPROM_SIZE):
+        self.base = base
+        self.buf = bytearray(size * REG_SIZE)
+        view = memoryview(self.buf)
+        for start in range(0, size, EEPROM_BURST_WORDS):
+            stop = min(start + EEPROM_BURST_WORDS, size)
+            iface.read_into(base + start, view[start*REG_SIZE:stop*REG_SIZE])
+
+    def offset(self, mem_addr, nbytes=REG_SIZE):
+        # byte offset into buf of the given word address
+        offset = (mem_addr - self.base) * REG_SIZE
+        if offset < 0 or offset + nbytes > len(self.buf):
+            raise ValueError(f"0x{mem_addr:04X} is not in the EEPROM image")
+        return offset
+
+    def view(self, mem_addr, count):
+        # a memoryview of count words, without copying
+        offset = self.offset(mem_addr, count * REG_SIZE)
+        return memoryview(self.buf)[offset:offset + count*REG_SIZE]
+
+    def read(self, mem_addr):
+        offset = self.offset(mem_addr)
+        return bytes(self.buf[offset:offset + REG_SIZE])
+    def read_into(self, mem_addr, buf):
+        offset = self.offset(mem_addr, len(buf))
+        for i in range(len(buf)):
+            buf[i] = self.buf[offset + i]
+    def write(self, mem_addr, buf):
+        raise ReadOnlyError("the EEPROM image can't be written")
+
+class _CachedWord:
+    # one register word and a Struct over it, reused between accesses
+    def __init__(self, proto):
+        self.buf = bytearray(REG_SIZE)
+        self.struct = Struct(self.buf, proto)
+        self.valid = False
+
 class RegisterMap:
-    def __init__(self, iface, register_map, readonly=False):
+    def __init__(self, iface, register_map, readonly=False, *,
+                 cache=False, volatile=()):
         # register_map should be a dict of { I2C address : FieldDesc(s) }
+        # with cache set, each register is read once and every field is served
+        # from that word; volatile registers are read again after refresh()
         self.iface = iface
         self.readonly = readonly
+        self.cache = cache
+        self.volatile = tuple(volatile)
         self._fields = self._build_lookup(register_map)
+        self._protos = {address: proto for address, proto in self._fields.values()}
+        self._words = {}
+        self._scratch = bytearray(0)
 
     @staticmethod
     def _build_lookup(register_map):
@@ -177,13 +239,16 @@ class RegisterMap:
         return lookup
 
     def __iter__(self):
-        return iter(self.keys())
+        return iter(self._fields)
     def __len__(self):
         return len(self._fields)
     def __contains__(self, name):
         return name in self._fields
 
     def __getitem__(self, name):
+        if self.cache:
+            return self._cached_word(name).struct[name]
+
         address, proto = self._fields[name]
 
         buf = self.iface.read(address)
@@ -194,6 +259,14 @@ class RegisterMap:
         if self.readonly:
             raise ReadOnlyError(f"can't write to '{name}': not permitted")
 
+        if self.cache:
+            word = self._cached_word(name)
+            word.struct[name] = value
+            self.iface.write(self._fields[name][0], word.buf)
+            # the camera may not keep what we wrote, so read it back next time
+            word.valid = False
+            return
+
         address, proto = self._fields[name]
 
         buf = bytearray(REG_SIZE)
@@ -201,3 +274,56 @@ class RegisterMap:
         struct = Struct(buf, proto)
         struct[name] = value
         self.iface.write(address, buf)
+
+    def _cached_word(self, name):
+        address = self._fields[name][0]
+        word = self._get_word(address)
+        if not word.valid:
+            self.iface.read_into(address, word.buf)
+            word.valid = True
+        return word
+
+    def _get_word(self, address):
+        word = self._words.get(address)
+        if word is None:
+            word = self._words[address] = _CachedWord(self._protos[address])
+        return word
+
+    def prefetch(self, address, count):
+        # read a run of registers in one transaction and cache every mapped
+        # word inside it; does nothing if they are all cached already
+        if not self.cache:
+            return
+        mapped = [addr for addr in self._protos if address <= addr < address + count]
+        if all(self._get_word(addr).valid for addr in mapped):
+            return
+
+        size = count * REG_SIZE
+        if len(self._scratch) < size:
+            self._scratch = bytearray(size)
+        buf = memoryview(self._scratch)[:size]
+        self.iface.read_into(address, buf)
+
+        for addr in mapped:
+            word = self._get_word(addr)
+            offset = (addr - address) * REG_SIZE
+            word.buf[0] = buf[offset]
+            word.buf[1] = buf[offset + 1]
+            word.valid = True
+
+    def refresh(self):
+        # start a new snapshot: volatile registers are read again when next used
+        for address in self.volatile:
+            word = self._words.get(address)
+            if word is not None:
+                word.valid = False
+
+    def invalidate(self, name=None):
+        # forget the cached copy of one field's register, or of all registers
+        if name is None:
+            for word in self._words.values():
+                word.valid = False
+            return
+        word = self._words.get(self._fields[name][0])
+        if word is not None:
+            word.valid = False
@@ -53,9 +53,11 @@ class StructProto:
                 self.signed[fld.name] = fld.signed_bits
 
 class Struct:
-    def __init__(self, buf, proto):
+    def __init__(self, buf, proto, offset=0):
+        # offset is in bytes, so one large buffer can hold many structs
+        self._buf = buf  # the struct only holds an address; keep buf alive
         self._signed = proto.signed
-        self._struct = uc_struct(addressof(buf), proto.layout, BIG_ENDIAN)
+        self._struct = uc_struct(addressof(buf) + offset, proto.layout, BIG_ENDIAN)
 
     def __getitem__(self, name):
         value = getattr(self._struct, name)
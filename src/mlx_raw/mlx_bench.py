@@ -0,0 +1,632 @@
+"""!
+@file mlx_bench.py
+This file contains host benchmarks for the raw MLX90640 driver. A fake I2C bus
+stands in for the camera and counts the transactions and bytes each driver
+operation needs, and the estimated bus time at 400 kHz is shown beside the
+time spent in Python.
+
+Run it from this directory, where the @c mlx90640 folder can be found, with
+the MicroPython Unix port, or with CPython 3 and the MicroPython stand-ins in
+@c host_shim:
+@code
+micropython mlx_bench.py
+PYTHONPATH=../host_shim python3 mlx_bench.py
+@endcode
+"""
+
+import utime as time
+import math
+from array import array
+from mlx90640 import MLX90640, CameraState
+from mlx90640.fake_i2c import FakeI2C
+from mlx90640.regmap import (
+    CameraInterface,
+    RegisterMap,
+    REGISTER_MAP,
+    EEPROM_MAP,
+    EEPROM_ADDRESS,
+    EEPROM_SIZE,
+    STATE_BLOCKS,
+)
+from mlx90640.calibration import (
+    NUM_ROWS,
+    NUM_COLS,
+    IMAGE_SIZE,
+    TEMP_K,
+    CALIB_STAGES,
+    PIX_CALIB_ADDRESS,
+    CameraCalibration,
+)
+from mlx90640.image import (
+    RawImage,
+    ProcessedImage,
+    BadPixelPlan,
+    Subpage,
+    ChessPattern,
+    InterleavedPattern,
+    PIX_DATA_ADDRESS,
+)
+
+## The I2C address of the fake camera
+CAM_ADDR = 0x33
+
+## Status register value announcing new data in subpage 0
+STATUS_DATA_READY = 0x0008
+
+## How many times each operation is repeated to get an average time
+REPEAT = 20
+
+## The RAM words which @c read_state() reads when there is calibration data
+STATE_WORDS = ('ta_vbe', 'cp_sp_0', 'gain', 'ta_ptat', 'cp_sp_1', 'vdd_pix')
+
+
+class WordAtATime:
+    """!
+    A camera interface which splits every read into one transaction per word,
+    the way the driver used to read its calibration data, for comparison.
+    """
+
+    def __init__(self, iface):
+        self.iface = iface
+
+    def read(self, mem_addr):
+        return self.iface.read(mem_addr)
+
+    def read_into(self, mem_addr, buf):
+        word = bytearray(2)
+        for offset in range(0, len(buf), 2):
+            self.iface.read_into(mem_addr + offset // 2, word)
+            buf[offset] = word[0]
+            buf[offset + 1] = word[1]
+
+
+def make_camera():
+    """!
+    Create a fake bus whose camera RAM holds a recognizable test frame.
+    @returns A tuple @c (i2c, iface) of the fake bus and a camera interface
+    """
+    i2c = FakeI2C(CAM_ADDR)
+    i2c.fill(PIX_DATA_ADDRESS, ((idx * 97) % 4001 - 2000
+                                for idx in range(IMAGE_SIZE)))
+    # scrambled but repeatable stand-in for factory calibration data
+    i2c.fill(EEPROM_ADDRESS, ((idx * 40503 + 12345) >> 3 & 0xFFFF
+                              for idx in range(EEPROM_SIZE)))
+    return i2c, CameraInterface(i2c, CAM_ADDR)
+
+
+def report(name, i2c, runs, elapsed_us):
+    """!
+    Print the bus traffic and time used by one benchmark.
+    """
+    print(f"{name:<36} {i2c.transactions // runs:>5} xfers "
+          f"{i2c.bytes_read // runs:>6} bytes "
+          f"{i2c.bus_time_us() // runs:>7} us bus "
+          f"{elapsed_us // runs:>7} us cpu")
+
+
+def bench_raw_read():
+    """!
+    Compare reading subpages one pixel at a time with bulk reads.
+    """
+    i2c, iface = make_camera()
+    for pattern in (ChessPattern, InterleavedPattern):
+        reference = None
+        for bulk in (False, True):
+            raw = RawImage(bulk=bulk)
+            i2c.reset_counts()
+            begin = time.ticks_us()
+            for run in range(REPEAT):
+                for sp_id in (0, 1):
+                    raw.read(iface, Subpage(pattern, sp_id).sp_range())
+            elapsed = time.ticks_diff(time.ticks_us(), begin)
+
+            name = f"{pattern.__name__} {'bulk' if bulk else 'per-pixel'}"
+            report(name + " frame", i2c, REPEAT, elapsed)
+            if reference is None:
+                reference = raw.pix
+            elif raw.pix != reference:
+                print("  MISMATCH between bulk and per-pixel frames")
+
+
+def bench_read_image():
+    """!
+    Count the traffic of a whole @c read_image() call, including the status
+    and control register accesses around the pixel reads.
+    """
+    i2c, iface = make_camera()
+    i2c.mem[0x800D] = ChessPattern.pattern_id << 12
+    camera = MLX90640(i2c, CAM_ADDR)
+    camera.setup()
+
+    i2c.reset_counts()
+    begin = time.ticks_us()
+    for run in range(REPEAT):
+        for sp_id in (0, 1):
+            i2c.mem[0x8000] = STATUS_DATA_READY | sp_id
+            camera.read_image()
+    elapsed = time.ticks_diff(time.ticks_us(), begin)
+    report("MLX90640.read_image frame", i2c, REPEAT, elapsed)
+
+
+def bench_read_state():
+    """!
+    Compare reading the six camera state words which @c read_state() uses
+    with calibration data one at a time, in the two 11-word bursts the
+    driver once used, and in the short runs of @c STATE_BLOCKS.
+    """
+    i2c, iface = make_camera()
+    i2c.fill(0x0700, range(0x2B))
+    cases = (("per-word", None),
+             ("two 11-word bursts", ((0x0700, 11), (0x0720, 11))),
+             ("STATE_BLOCKS runs", STATE_BLOCKS))
+    for name, blocks in cases:
+        registers = MLX90640(i2c, CAM_ADDR).registers
+        i2c.reset_counts()
+        begin = time.ticks_us()
+        for run in range(REPEAT):
+            registers.refresh()
+            for address, count in blocks or ():
+                registers.prefetch(address, count)
+            for field in STATE_WORDS:
+                registers[field]
+        elapsed = time.ticks_diff(time.ticks_us(), begin)
+        report(f"state words {name}", i2c, REPEAT, elapsed)
+
+
+def bench_state_cache():
+    """!
+    Compare reading the camera state for every subpage with serving it from
+    the state cache, which reads it again once a second.
+    """
+    i2c, iface = make_camera()
+    i2c.fill(0x0700, range(0x2B))
+    camera = MLX90640(i2c, CAM_ADDR)
+    camera.load_calibration()
+    for cached in (False, True):
+        if cached:
+            cache = camera.cache_state(refresh_ms=1000)
+        i2c.reset_counts()
+        begin = time.ticks_us()
+        for run in range(2 * REPEAT):
+            # as after polling for a new subpage
+            camera.registers.refresh()
+            camera.get_state()
+        elapsed = time.ticks_diff(time.ticks_us(), begin)
+        report(f"get_state {'cached' if cached else 'uncached'} subpage",
+               i2c, 2 * REPEAT, elapsed)
+    print(f"  state read {cache.refreshes} times for {2 * REPEAT} subpages")
+
+
+def bench_calibration():
+    """!
+    Compare building the calibration straight from the bus with building it
+    from an in-memory copy of the EEPROM.
+    """
+    i2c, iface = make_camera()
+    camera = MLX90640(i2c, CAM_ADDR)
+    results = []
+    for mode in ("per-word", "bus", "image"):
+        i2c.reset_counts()
+        begin = time.ticks_us()
+        if mode == "image":
+            calib = CameraCalibration(camera.read_eeprom(), camera.eeprom)
+        else:
+            src = WordAtATime(iface) if mode == "per-word" else iface
+            calib = CameraCalibration(src, RegisterMap(src, EEPROM_MAP,
+                                                       readonly=True))
+        calib.build()
+        elapsed = time.ticks_diff(time.ticks_us(), begin)
+        report(f"CameraCalibration {mode}", i2c, 1, elapsed)
+        results.append((calib.pix_os_ref, calib.pix_alpha, calib.pix_kta,
+                        calib.ct, calib.ksto))
+    if results[0] != results[1] or results[0] != results[2]:
+        print("  MISMATCH between calibration modes")
+
+
+## Calibration cache file written by the benchmark
+CACHE_PATH = "mlx_calib_bench.bin"
+
+
+def bench_calibration_cache():
+    """!
+    Compare building the calibration with loading it from a cache file.
+    """
+    import os
+    from gc import collect, mem_alloc
+
+    try:
+        os.remove(CACHE_PATH)
+    except OSError:
+        pass
+
+    i2c, iface = make_camera()
+    results = []
+    for mode in ("build and save", "load"):
+        camera = MLX90640(i2c, CAM_ADDR)
+        collect()
+        heap = mem_alloc()
+        begin = time.ticks_us()
+        calib = camera.load_calibration(cache_path=CACHE_PATH)
+        elapsed = time.ticks_diff(time.ticks_us(), begin)
+        print(f"CameraCalibration {mode:<18} {elapsed:>7} us cpu "
+              f"{mem_alloc() - heap:>6} bytes kept")
+        results.append((calib.pix_os_ref, calib.pix_alpha, calib.pix_kta,
+                        calib.il_offset, calib.outliers, calib.ct,
+                        calib.kv_avg, calib.alpha_ext))
+    if results[0] != results[1]:
+        print("  MISMATCH between built and cached calibration")
+    os.remove(CACHE_PATH)
+
+
+def bench_calibration_stages():
+    """!
+    Build the calibration one stage at a time, showing the heap in use at
+    the end of each stage, before garbage was collected, counted from before
+    the first stage, so it takes in what the earlier stages kept; and how
+    much each stage kept.
+    """
+    from gc import collect, mem_alloc
+
+    i2c, iface = make_camera()
+    camera = MLX90640(i2c, CAM_ADDR)
+    collect()
+    base = mem_alloc()
+    calib = CameraCalibration(camera.read_eeprom(), camera.eeprom)
+    for stage, _ in CALIB_STAGES:
+        collect()
+        before = mem_alloc()
+        begin = time.ticks_us()
+        calib.build(stage)
+        elapsed = time.ticks_diff(time.ticks_us(), begin)
+        heap = mem_alloc() - base
+        collect()
+        print(f"CameraCalibration stage {stage:<12} {elapsed:>7} us cpu "
+              f"{heap:>6} bytes heap so far "
+              f"{mem_alloc() - before:>6} bytes kept")
+    # build() has let go of the pixel words; the EEPROM copy goes with the
+    # register map which still refers to it
+    collect()
+    before = mem_alloc()
+    camera.eeprom = None
+    collect()
+    print(f"CameraCalibration EEPROM copy let go {before - mem_alloc():>6} "
+          f"bytes freed")
+
+
+def bench_frame_stats():
+    """!
+    Compare reading frames with and without statistics gathered as pixels
+    are decoded, against the two min() and two max() scans the display code
+    used to make, and check the statistics.
+    """
+    i2c, iface = make_camera()
+    for stats in (False, True):
+        raw = RawImage(stats=stats)
+        begin = time.ticks_us()
+        for run in range(REPEAT):
+            if stats:
+                raw.stats.reset()
+            for sp_id in (0, 1):
+                raw.read(iface, ChessPattern.sp_range(sp_id))
+        elapsed = time.ticks_diff(time.ticks_us(), begin)
+        name = f"RawImage frame {'with' if stats else 'without'} stats"
+        print(f"{name:<36} {elapsed // REPEAT:>44} us cpu")
+
+    begin = time.ticks_us()
+    for run in range(REPEAT):
+        limits = (min(raw), max(raw), min(raw), max(raw))
+    elapsed = time.ticks_diff(time.ticks_us(), begin)
+    print(f"{'min() and max() scans, twice':<36} {elapsed // REPEAT:>44} us cpu")
+
+    pix = raw.pix
+    stats = raw.stats
+    bins = [0] * len(stats.hist)
+    for value in pix:
+        b = (value - stats.hist_lo) >> stats.hist_shift
+        bins[min(max(b, 0), len(bins) - 1)] += 1
+    if (stats.limits() != (min(pix), max(pix), list(pix).index(min(pix)),
+                           list(pix).index(max(pix)))
+            or stats.total != sum(pix) or stats.count != IMAGE_SIZE
+            or list(stats.hist) != bins):
+        print("  MISMATCH between frame statistics and a scan")
+
+
+## Bad pixels used by the repair benchmark, including corners and row ends
+BAD_PIXELS = (0, 31, 32, 100, 101, 400, 500, 767)
+
+
+def old_interpolate_bad_pixels(buf, bad_pixels):
+    """!
+    The old repair, which works out every pixel's neighbours on each frame
+    and lets them wrap around from one row's end to the next.
+    """
+    for bad_idx in bad_pixels:
+        count = 0
+        total = 0
+        for row in (-1, 0, 1):
+            for col in (-1, 0, 1):
+                idx = bad_idx + row * NUM_COLS + col
+                if (row or col) and idx in range(IMAGE_SIZE) \
+                        and idx not in bad_pixels:
+                    count += 1
+                    total += buf[idx]
+        if count > 0:
+            buf[bad_idx] = total/count
+
+
+def bench_bad_pixels():
+    """!
+    Compare repairing bad pixels the old way with applying a plan made once.
+    """
+    buf = array('f', (20.0 + idx % 7 for idx in range(IMAGE_SIZE)))
+    begin = time.ticks_us()
+    plan = BadPixelPlan(BAD_PIXELS)
+    elapsed = time.ticks_diff(time.ticks_us(), begin)
+    print(f"{'BadPixelPlan made once':<36} {elapsed:>44} us cpu")
+
+    for name, repair in (("old per-frame neighbours", lambda b:
+                          old_interpolate_bad_pixels(b, BAD_PIXELS)),
+                         ("BadPixelPlan.apply", plan.apply)):
+        begin = time.ticks_us()
+        for run in range(REPEAT):
+            repair(buf)
+        elapsed = time.ticks_diff(time.ticks_us(), begin)
+        print(f"{name + ' frame':<36} {elapsed // REPEAT:>44} us cpu")
+
+
+def bench_subpage_tables():
+    """!
+    Compare walking the whole image to find a subpage's pixels, as was done
+    for every subpage read, with iterating the precomputed index table.
+    """
+    for pattern in (ChessPattern, InterleavedPattern):
+        pattern.sp_range(0)     # build the tables outside the timing
+        for mode in ("generator", "table"):
+            begin = time.ticks_us()
+            for run in range(REPEAT):
+                for sp_id in (0, 1):
+                    if mode == "table":
+                        indices = pattern.sp_range(sp_id)
+                    else:
+                        indices = (idx for idx, sp
+                                   in enumerate(pattern.iter_sp())
+                                   if sp == sp_id)
+                    for idx in indices:
+                        pass
+            elapsed = time.ticks_diff(time.ticks_us(), begin)
+            name = f"{pattern.__name__} {mode} indices"
+            print(f"{name:<36} {elapsed // REPEAT:>44} us cpu")
+
+
+def plausible_eeprom(i2c):
+    """!
+    Replace the scrambled calibration words of a fake camera with ones in the
+    ranges a real camera has, so calibrations built from them go through the
+    same decoding as on a real camera. The pixel sensitivities are put near
+    the top of their 16 bits, so a compact calibration has to shift them.
+    The band temperatures are -40, 0, 160 and 320 C.
+    """
+    eeprom = RegisterMap(CameraInterface(i2c, CAM_ADDR), EEPROM_MAP)
+    for name, value in (
+            # offsets of -60 to -96
+            ('pix_os_average', -78), ('scale_occ_row', 1),
+            ('scale_occ_col', 1), ('scale_occ_rem', 0),
+            # sensitivities of about 1.2e-7, in units of 2**-38
+            ('pix_sensitivity_average', 32003), ('alpha_scale', 8),
+            ('scale_acc_row', 8), ('scale_acc_col', 8), ('scale_acc_rem', 5),
+            # kta of about 0.0035, in units of 2**-15
+            ('kta_avg_re_ce', 110), ('kta_avg_re_co', 115),
+            ('kta_avg_ro_ce', 120), ('kta_avg_ro_co', 105),
+            ('kta_scale_1', 7), ('kta_scale_2', 2),
+            ('kv_avg_re_ce', 4), ('kv_avg_re_co', 4), ('kv_avg_ro_ce', 4),
+            ('kv_avg_ro_co', 3), ('kv_scale', 3),
+            ('il_chess_c1', 0), ('il_chess_c2', 0), ('il_chess_c3', 0),
+            ('ksta', -16),
+            ('ksto_1', -79), ('ksto_2', -105), ('ksto_3', -92),
+            ('ksto_4', -79), ('ksto_scale', 9),
+            ('step', 2), ('ct3', 8), ('ct4', 8)):
+        eeprom[name] = value
+
+    def nibbles(values):
+        # pack signed 4-bit values four to a word, the first lowest
+        values = tuple(values)
+        for start in range(0, len(values), 4):
+            word = 0
+            for shift, value in enumerate(values[start:start + 4]):
+                word |= (value & 0xF) << 4 * shift
+            yield word
+
+    i2c.fill(0x2412, nibbles(row % 5 - 2 for row in range(NUM_ROWS)))
+    i2c.fill(0x2418, nibbles(col % 7 - 3 for col in range(NUM_COLS)))
+    i2c.fill(0x2422, nibbles(row % 5 - 2 for row in range(NUM_ROWS)))
+    i2c.fill(0x2428, nibbles(col % 7 - 3 for col in range(NUM_COLS)))
+
+    def pixel_word(idx):
+        # no kta of zero, so no word is all zeros and marks a failed pixel
+        kta = idx % 6 - 3
+        kta += kta >= 0
+        return ((idx % 11 - 5) << 10 | ((idx % 13 - 6) & 0x3F) << 4
+                | (kta & 0x7) << 1)
+
+    i2c.fill(PIX_CALIB_ADDRESS, (pixel_word(idx) for idx in range(IMAGE_SIZE)))
+
+
+def plausible_scene(calib, t_min=20, t_max=60):
+    """!
+    Make a raw frame of a scene between @c t_min and @c t_max degrees C seen
+    through a camera with a calibration from @c plausible_eeprom().
+    @returns A tuple @c (raw, state) of a @c RawImage and a @c CameraState
+    """
+    ta = 5.0
+    state = CameraState(vdd=0.05, ta=ta, ta_r=(ta + 25 + TEMP_K)**4,
+                        gain=1.03, gain_cp=(0.0, 0.0))
+    raw = RawImage()
+    for idx in range(IMAGE_SIZE):
+        row, col = divmod(idx, NUM_COLS)
+        to = t_min + (row*7 + col*3) % 41 * (t_max - t_min) / 40
+        alpha = calib.pix_alpha[idx]*(1 + calib.ksta*ta)
+        v_ir = alpha*((to + TEMP_K)**4 - state.ta_r)
+        kv = calib.kv_avg[row % 2][col % 2]
+        offset = calib.pix_os_ref[idx]*(1 + calib.pix_kta[idx]*ta)*(1 + kv*state.vdd)
+        raw.pix[idx] = round((v_ir + offset)/state.gain)
+    return raw, state
+
+
+def plausible_calibrations():
+    """!
+    Build a float and a compact calibration, each with every stage built,
+    from the EEPROM of a fake camera holding @c plausible_eeprom() words.
+    @returns A list of tuples @c (calib, kept) of each calibration and the
+             bytes of memory it keeps
+    """
+    from gc import collect, mem_alloc
+
+    i2c, iface = make_camera()
+    plausible_eeprom(i2c)
+    camera = MLX90640(i2c, CAM_ADDR)
+    image = camera.read_eeprom()
+    calibs = []
+    for compact in (False, True):
+        collect()
+        heap = mem_alloc()
+        calib = CameraCalibration(image, camera.eeprom, compact=compact)
+        calib.build()
+        collect()
+        calibs.append((calib, mem_alloc() - heap))
+    return calibs
+
+
+def reference_temperature(calib, raw, idx, state, il_offset=0.0):
+    """!
+    Compute one pixel's temperature step by step as the datasheet does, for
+    checking the fused calculation in @c ProcessedImage.
+    @param   il_offset The pixel's interleave offset, for a frame read with
+             the interleaved pattern
+    """
+    row, col = divmod(idx, NUM_COLS)
+    kv = calib.kv_avg[row % 2][col % 2]
+    offset = calib.pix_os_ref[idx]
+    offset *= (1 + calib.pix_kta[idx]*state.ta)*(1 + kv*state.vdd)
+    v_ir = (raw.pix[idx]*state.gain - offset + il_offset)/calib.emissivity
+    alpha = calib.pix_alpha[idx]*(1 + calib.ksta*state.ta)
+    s_x = calib.ksto[1]*(alpha**3*v_ir + alpha**4*state.ta_r)**0.25
+    to = v_ir/(alpha*(1 - calib.ksto[1]*TEMP_K) + s_x) + state.ta_r
+    return to**0.25 - TEMP_K + calib.drift
+
+
+def bench_processed_image():
+    """!
+    Time turning a raw frame into temperatures, with float and 16-bit
+    fixed-point calibrations built from the same EEPROM, and compare the
+    results with a plain datasheet calculation using the float calibration.
+    The memory kept by each calibration and its processed image is shown,
+    and how far the compact per-pixel coefficients are from the float ones.
+    Then a scene reaching into the extended range is processed with each
+    calibration and the results compared.
+    """
+    from gc import collect, mem_alloc
+
+    calibs = plausible_calibrations()
+    calib, compact = calibs[0][0], calibs[1][0]
+    raw, state = plausible_scene(calib)
+
+    # The compact numerators are decoded from the same EEPROM words as the
+    # floats, and are shifted where they don't fit 16 bits
+    for name in ("pix_kta", "pix_alpha"):
+        scale = 1 << getattr(compact, name + "_exp")
+        error = max(abs(n / scale / f - 1) for n, f
+                    in zip(getattr(compact, name), getattr(calib, name)))
+        print(f"{'CameraCalibration compact ' + name:<36} "
+              f"{error * 100:>53.5f} % max error")
+
+    begin = time.ticks_us()
+    expected = [reference_temperature(calib, raw, idx, state)
+                for idx in range(IMAGE_SIZE)]
+    ref_elapsed = time.ticks_diff(time.ticks_us(), begin)
+    print(f"{'datasheet reference frame':<36} {ref_elapsed:>44} us cpu")
+
+    for calib, calib_bytes in calibs:
+        collect()
+        heap = mem_alloc()
+        image = ProcessedImage(calib)
+        collect()
+        kept = calib_bytes + mem_alloc() - heap
+
+        begin = time.ticks_us()
+        for run in range(REPEAT):
+            for sp_id in (0, 1):
+                image.update(raw, Subpage(ChessPattern, sp_id), state)
+        elapsed = time.ticks_diff(time.ticks_us(), begin)
+
+        error = max(abs(t - e) for t, e in zip(image.buf, expected))
+        name = (f"ProcessedImage {'compact' if calib.compact else 'float'} "
+                f"frame")
+        print(f"{name:<36} {elapsed // REPEAT:>44} us cpu "
+              f"{kept:>6} bytes kept {error:>9.6f} C max error")
+
+    # The extended range: a scene from below 0 C to above the third band
+    # temperature, with each pixel's band found by _get_range_band(),
+    # checked against the float calculation
+    calib = calibs[0][0]
+    raw, state = plausible_scene(calib, t_min=-30, t_max=250)
+    expected = None
+    for calib in (calib, compact):
+        image = ProcessedImage(calib, extended=True)
+        for sp_id in (0, 1):
+            image.update(raw, Subpage(ChessPattern, sp_id), state)
+        name = (f"ProcessedImage {'compact' if calib.compact else 'float'} "
+                f"extended")
+        if expected is None:
+            expected = array('f', image.buf)
+            bands = [0, 0, 0, 0]
+            for t in expected:
+                bands[image._get_range_band(t)] += 1
+            print(f"{name:<36} pixels in bands 0 to 3: {bands}")
+            continue
+        error = max(abs(t - e) for t, e in zip(image.buf, expected))
+        print(f"{name:<36} {error:>53.6f} C max difference")
+
+
+def bench_compact_interleaved():
+    """!
+    Check the compact calibration on an interleaved frame whose interleave
+    offsets have more fraction bits than the integers of @c ProcessedImage,
+    so they are shifted right rather than left, against the float one and a
+    plain datasheet calculation.
+    """
+    (calib, _), (compact, _) = plausible_calibrations()
+    raw, state = plausible_scene(calib)
+
+    # Offsets below one take 15 fraction bits, more than the 14 or so
+    # left for the integers by 16-bit raw pixels
+    compact.il_offset_exp = 15
+    for idx in range(IMAGE_SIZE):
+        calib.il_offset[idx] = 0.1 + idx % 7 * 0.1
+        compact.il_offset[idx] = round(calib.il_offset[idx] * (1 << 15))
+
+    expected = [reference_temperature(calib, raw, idx, state,
+                                      calib.il_offset[idx])
+                for idx in range(IMAGE_SIZE)]
+    for calib in (calib, compact):
+        image = ProcessedImage(calib)
+        for sp_id in (0, 1):
+            image.update(raw, Subpage(InterleavedPattern, sp_id), state)
+        error = max(abs(t - e) for t, e in zip(image.buf, expected))
+        name = (f"ProcessedImage {'compact' if calib.compact else 'float'} "
+                f"interleaved")
+        print(f"{name:<36} {error:>53.6f} C max error")
+
+
+if __name__ == "__main__":
+    bench_raw_read()
+    bench_subpage_tables()
+    bench_read_image()
+    bench_read_state()
+    bench_state_cache()
+    bench_calibration()
+    bench_calibration_cache()
+    bench_calibration_stages()
+    bench_processed_image()
+    bench_compact_interleaved()
+    bench_bad_pixels()
+    bench_frame_stats()
@@ -0,0 +1,86 @@
+"""! @file target_queue.py
+    This file contains a queue of targets found by the turret's camera, which
+    lets a task which finds several targets at once hand them one at a time
+    to the tasks which aim and shoot.
+"""
+
+import utime
+import task_share
+
+## The bits of @c ticks_ms() kept with each target: few enough to be held
+#  exactly in a float item, and enough for targets hours old
+_STAMP_MASK = 0x7FFFFF
+
+
+class TargetQueue(task_share.Queue):
+    """!
+    A queue of targets, each held as four items in a @c task_share.Queue:
+    the distances in encoder ticks along the x and y axes to the target, the
+    sum of the block of pixels in which it was found and the time at which
+    it was seen. The distances are worked out when the target is queued,
+    from the image it was found in, so they stay right however long the
+    target waits, and the time tells how long that was. A target is always
+    put and taken as a whole.
+    """
+
+    def __init__(self, count, thread_protect=False, name=None):
+        """!
+        Allocate memory for the queue.
+        @param count The most targets which the queue can hold
+        @param thread_protect @c True if mutual exclusion protection is used
+        @param name A short name for the queue
+        """
+        super().__init__('f', 4 * count, thread_protect=thread_protect,
+                         name=name)
+
+
+    def put_target(self, target):
+        """!
+        Put a target into the queue, if there is room for it.
+        @param target A tuple @c (dist_x, dist_y, total, timestamp), where
+               @c timestamp is the @c ticks_ms() time at which the image the
+               target was found in was read
+        @return @c True if the target was put in the queue, @c False if the
+                queue was full
+        """
+        if self.num_in() + 4 > self._size:
+            return False
+        dist_x, dist_y, total, timestamp = target
+        self.put(dist_x)
+        self.put(dist_y)
+        self.put(total)
+        self.put(timestamp & _STAMP_MASK)
+        return True
+
+
+    def put_targets(self, targets):
+        """!
+        Replace the targets in the queue with new ones.
+        @param targets An iterable of tuples @c (dist_x, dist_y, total,
+               timestamp), best first
+        """
+        self.clear()
+        for target in targets:
+            if not self.put_target(target):
+                break
+
+
+    def targets(self):
+        """!
+        Check how many targets are in the queue.
+        @return The number of targets in the queue
+        """
+        return self.num_in() // 4
+
+
+    def get_target(self):
+        """!
+        Take the oldest target from the queue. Call @c targets() first to make
+        sure there is one, as this waits until there is.
+        @return A tuple @c (dist_x, dist_y, total, timestamp) for the target
+        """
+        dist_x, dist_y, total = self.get(), self.get(), self.get()
+        # Only the low bits of the time were kept, which give its age
+        now = utime.ticks_ms()
+        age = (now - int(self.get())) & _STAMP_MASK
+        return dist_x, dist_y, total, utime.ticks_add(now, -age)
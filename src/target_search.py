@@ -0,0 +1,628 @@
+"""! @file target_search.py
+    This file contains the search algorithms used by the turret to find the
+    hottest block of pixels in a thermal camera image, which is taken to be
+    the target. Images are flat arrays of @c NUM_ROWS by @c NUM_COLS pixels
+    stored row by row, as in the camera driver.
+"""
+
+from array import array
+from mlx_raw.mlx90640.calibration import NUM_ROWS, NUM_COLS
+
+
+class ForegroundFilter:
+    """!
+    Separates targets from the scene behind them by keeping a slowly moving
+    average of each pixel, the background, and passing on only how far each
+    pixel is above it. Warm things which stay put, such as lamps or sunny
+    walls, fade into the background, while people moving about stand out.
+
+    The background is an exponential moving average kept in fixed point in
+    an array, and is updated in place for just the pixels of each subpage.
+    The total of the foreground is kept up to date as well, so an image
+    with nothing in it can be passed over without searching it.
+    """
+
+    ## Fraction bits of the fixed-point background values
+    FRACTION = 8
+
+    ## Marks a background pixel which has not yet been seen
+    _UNSEEN = -0x40000000
+
+    def __init__(self, shift=5, floor=20, rows=NUM_ROWS, cols=NUM_COLS):
+        """!
+        Allocate the background and foreground arrays.
+        @param shift Each update moves a background pixel by 1 / 2**shift of
+               the way to the new value, so about 2**shift updates of a
+               pixel pass before a change is taken up into the background
+        @param floor How far above the background a pixel must be to count
+               as foreground at all, which keeps out the camera's noise
+        @param rows The number of rows of pixels in an image
+        @param cols The number of columns of pixels in an image
+        """
+        self.shift = shift
+        self.floor = floor
+
+        # The background in units of 1 / 2**FRACTION
+        self._background = array('l', (ForegroundFilter._UNSEEN
+                                       for _ in range(rows * cols)))
+
+        ## How far each pixel is above the background, less @c floor, or
+        #  zero; this is the image to be searched
+        self.pix = array('h', (0 for _ in range(rows * cols)))
+
+        ## The total of @c pix
+        self.energy = 0
+
+
+    def update(self, image, indices, learn=True):
+        """!
+        Bring the foreground up to date with new pixel data.
+        @param image A flat array holding the newest pixel values
+        @param indices The indices of the pixels which may have changed,
+               usually those of the subpage just read
+        @param learn If @c True, the background takes up some of the new
+               values; if @c False, as for pixels repaired from neighbours
+               which have already been counted, it is left alone
+        @return The total of the foreground over the pixels given
+        """
+        background = self._background
+        pix = self.pix
+        frac = ForegroundFilter.FRACTION
+        shift = self.shift
+        floor = self.floor
+        unseen = ForegroundFilter._UNSEEN
+        energy = self.energy
+        given = 0
+
+        for idx in indices:
+            value = image[idx]
+            level = background[idx]
+            if level == unseen:
+                level = value << frac
+            elif learn:
+                level += ((value << frac) - level) >> shift
+            if learn:
+                background[idx] = level
+            fore = value - (level >> frac) - floor
+            if fore < 0:
+                fore = 0
+            energy += fore - pix[idx]
+            given += fore
+            pix[idx] = fore
+
+        self.energy = energy
+        return given
+
+
+def block_centroid(image, row, col, block_size=5, background=None,
+                   cols=NUM_COLS, block_width=None):
+    """!
+    Find the centre of a block of pixels weighted by how hot each pixel is,
+    which places a target to a fraction of a pixel rather than at the middle
+    of the block which holds it. Each pixel counts by how far it is above the
+    background, and pixels at or below it don't count at all, so the warm
+    surroundings don't pull the centre towards the middle of the block.
+    @param image A flat array of pixel values stored row by row
+    @param row The row of the top left pixel of the block
+    @param col The column of the top left pixel of the block
+    @param block_size The height and width of the block
+    @param background The background level, or @c None to use the value of
+           the coolest pixel in the block
+    @param cols The number of columns of pixels in an image
+    @param block_width The width of the block, if not @c block_size
+    @return A tuple @c (row, col) of floats in pixels, where each pixel's
+            centre has whole numbers; the middle of the block is returned if
+            no pixel is above the background
+    """
+    width = block_size if block_width is None else block_width
+    first = row * cols + col
+    last = first + (block_size - 1) * cols
+
+    if background is None:
+        background = image[first]
+        for base in range(first, last + 1, cols):
+            for idx in range(base, base + width):
+                if image[idx] < background:
+                    background = image[idx]
+
+    weight = row_moment = col_moment = 0
+    for i, base in enumerate(range(first, last + 1, cols)):
+        for j in range(width):
+            excess = image[base + j] - background
+            if excess > 0:
+                weight += excess
+                row_moment += i * excess
+                col_moment += j * excess
+
+    if not weight:
+        return row + (block_size - 1) / 2, col + (width - 1) / 2
+    return row + row_moment / weight, col + col_moment / weight
+
+
+def _top_blocks(sums, across, stride, height, width, count, min_total=None,
+                min_fraction=0.0):
+    """!
+    Pick the blocks with the greatest sums which don't overlap, best first,
+    by non-maximum suppression.
+    @param sums The sum of each block tried, row by row
+    @param across The number of blocks tried in each row
+    @param stride The distance in pixels between blocks tried
+    @param height The height of the blocks
+    @param width The width of the blocks
+    @param count The most blocks to be picked
+    @param min_total Blocks whose sum is less than this aren't picked, or
+           @c None to pick blocks however small their sum
+    @param min_fraction Blocks whose sum is less than this fraction of the
+           best block's aren't picked
+    @return A list of up to @c count tuples @c (row, col, total), each giving
+            the top left pixel of a block and the sum of its pixels
+    """
+    found = []
+    least = min_total
+    for _ in range(count):
+        best_sum = None
+        for pos in range(len(sums)):
+            total = sums[pos]
+            if best_sum is None or total > best_sum:
+                row = (pos // across) * stride
+                col = (pos % across) * stride
+                for taken_row, taken_col, _ in found:
+                    if (-height < row - taken_row < height
+                            and -width < col - taken_col < width):
+                        break
+                else:
+                    best_sum = total
+                    best_row, best_col = row, col
+        if best_sum is None or (least is not None and best_sum < least):
+            break
+        if not found and min_fraction:
+            # The rest are measured against the best block
+            share = best_sum * min_fraction
+            if least is None or share > least:
+                least = share
+        found.append((best_row, best_col, best_sum))
+
+    return found
+
+
+class SubpageBlockSearch:
+    """!
+    Finds the block of pixels with the greatest sum, updating its running
+    sums using only the pixels which changed in the newest subpage.
+
+    For each pixel the search keeps the sum of the column of @c block_size
+    pixels starting there and going down. When a subpage arrives, each
+    changed pixel adjusts at most @c block_size of those column sums, then
+    one pass sliding along each row of column sums finds the best block.
+    That is a few thousand additions per subpage rather than the 14,000 or
+    so needed to add up every block from scratch. The same pass can instead
+    keep the sum of every block, from which several blocks which don't
+    overlap are picked as in @c TopBlockSearch.
+    """
+
+    def __init__(self, block_size=5, rows=NUM_ROWS, cols=NUM_COLS, count=1,
+                 min_total=None, min_fraction=0.0):
+        """!
+        Allocate the arrays used by the search.
+        @param block_size The height and width of the blocks searched
+        @param rows The number of rows of pixels in an image
+        @param cols The number of columns of pixels in an image
+        @param count The most blocks to be found by @c best_blocks()
+        @param min_total Blocks whose sum is less than this aren't found by
+               @c best_blocks(), or @c None to find blocks however small
+        @param min_fraction Blocks whose sum is less than this fraction of
+               the best block's aren't found by @c best_blocks()
+        """
+        self.block_size = block_size
+        self.rows = rows
+        self.cols = cols
+        self.count = count
+        self.min_total = min_total
+        self.min_fraction = min_fraction
+
+        ## The pixel values from which the sums were last computed
+        self.pix = array('h', (0 for _ in range(rows * cols)))
+
+        # The sum of block_size pixels going down from each pixel position
+        # in the rows where a block can start
+        self._col_sums = array('l', (0 for _ in range((rows - block_size + 1)
+                                                      * cols)))
+
+        # The sum of each block, row by row, if several are to be found
+        if count > 1:
+            self._block_sums = array('l', (0 for _ in range(
+                (rows - block_size + 1) * (cols - block_size + 1))))
+
+        ## Bit n is set once subpage n has been given to @c update()
+        self.subpages = 0
+
+
+    @property
+    def complete(self):
+        """!
+        @c True once both subpages have been seen, so every pixel is real.
+        """
+        return self.subpages == 0b11
+
+
+    def update(self, image, indices, subpage=None):
+        """!
+        Bring the running sums up to date with new pixel data.
+        @param image A flat array holding the newest pixel values
+        @param indices The indices of the pixels which may have changed,
+               usually those of the subpage just read
+        @param subpage The number of the subpage read, if any
+        """
+        pix = self.pix
+        sums = self._col_sums
+        cols = self.cols
+        block = self.block_size
+        last_row = self.rows - block
+
+        for idx in indices:
+            delta = image[idx] - pix[idx]
+            if delta:
+                pix[idx] += delta
+                row = idx // cols
+                col = idx - row * cols
+                for top in range(max(0, row - block + 1),
+                                 min(row, last_row) + 1):
+                    sums[top * cols + col] += delta
+
+        if subpage is not None:
+            self.subpages |= 1 << subpage
+
+
+    def best(self):
+        """!
+        Find the block with the greatest sum. Where blocks tie, the first one
+        found going row by row from the top left wins.
+        @return A tuple @c (row, col, total) giving the top left pixel of the
+                best block and the sum of its pixels
+        """
+        sums = self._col_sums
+        cols = self.cols
+        block = self.block_size
+
+        best_sum = None
+        best_row, best_col = 0, 0
+        for row in range(self.rows - block + 1):
+            base = row * cols
+            total = 0
+            for col in range(block):
+                total += sums[base + col]
+            for col in range(cols - block + 1):
+                if col:
+                    total += sums[base + col + block - 1] - sums[base + col - 1]
+                if best_sum is None or total > best_sum:
+                    best_sum = total
+                    best_row, best_col = row, col
+
+        return best_row, best_col, best_sum
+
+
+    def best_blocks(self):
+        """!
+        Find the blocks with the greatest sums which don't overlap, as
+        @c TopBlockSearch.search_top() does. The search must have been made
+        with @c count more than one.
+        @return A list of up to @c count tuples @c (row, col, total), each
+                giving the top left pixel of a block and the sum of its
+                pixels, best first; it is empty if even the best block is
+                below @c min_total
+        """
+        sums = self._col_sums
+        blocks = self._block_sums
+        cols = self.cols
+        block = self.block_size
+        across = cols - block + 1
+
+        pos = 0
+        for row in range(self.rows - block + 1):
+            base = row * cols
+            total = 0
+            for col in range(block):
+                total += sums[base + col]
+            for col in range(across):
+                if col:
+                    total += sums[base + col + block - 1] - sums[base + col - 1]
+                blocks[pos] = total
+                pos += 1
+
+        return _top_blocks(blocks, across, 1, block, block, self.count,
+                           self.min_total, self.min_fraction)
+
+
+class BruteForceSearch:
+    """!
+    Finds the block of pixels with the greatest sum by adding up every block
+    from scratch, as the turret first did. It needs no memory beyond the
+    image, but takes an addition for each pixel of each block.
+    """
+
+    def __init__(self, block_size=5, stride=1, rows=NUM_ROWS, cols=NUM_COLS,
+                 block_width=None):
+        """!
+        Set up the search.
+        @param block_size The height and width of the blocks searched
+        @param stride The distance in pixels between blocks tried, in both
+               directions
+        @param rows The number of rows of pixels in an image
+        @param cols The number of columns of pixels in an image
+        @param block_width The width of the blocks, if not @c block_size
+        """
+        self.block_size = block_size
+        self.block_width = block_size if block_width is None else block_width
+        self.stride = stride
+        self.rows = rows
+        self.cols = cols
+
+
+    def search(self, image):
+        """!
+        Find the block with the greatest sum. Where blocks tie, the first one
+        found going row by row from the top left wins.
+        @param image A flat array of pixel values stored row by row
+        @return A tuple @c (row, col, total) giving the top left pixel of the
+                best block and the sum of its pixels
+        """
+        cols = self.cols
+        height = self.block_size
+        width = self.block_width
+
+        best_sum = None
+        best_row, best_col = 0, 0
+        for row in range(0, self.rows - height + 1, self.stride):
+            for col in range(0, cols - width + 1, self.stride):
+                total = 0
+                for idx in range(row * cols + col, (row + height) * cols + col,
+                                 cols):
+                    for j in range(idx, idx + width):
+                        total += image[j]
+                if best_sum is None or total > best_sum:
+                    best_sum = total
+                    best_row, best_col = row, col
+
+        return best_row, best_col, best_sum
+
+
+class IntegralBlockSearch:
+    """!
+    Finds the block of pixels with the greatest sum using a summed-area
+    table, also called an integral image.
+
+    Each entry of the table holds the sum of all pixels above and to the left
+    of it, so one pass over the image fills it in and the sum of any block is
+    then found from its four corners. The work is a few additions per pixel
+    and per block, whatever the block size. The table is allocated once and
+    takes four bytes for each pixel, plus one row and column of zeros.
+    """
+
+    def __init__(self, block_size=5, stride=1, rows=NUM_ROWS, cols=NUM_COLS,
+                 block_width=None):
+        """!
+        Allocate the summed-area table used by the search.
+        @param block_size The height and width of the blocks searched
+        @param stride The distance in pixels between blocks tried, in both
+               directions
+        @param rows The number of rows of pixels in an image
+        @param cols The number of columns of pixels in an image
+        @param block_width The width of the blocks, if not @c block_size
+        """
+        self.block_size = block_size
+        self.block_width = block_size if block_width is None else block_width
+        self.stride = stride
+        self.rows = rows
+        self.cols = cols
+
+        # Entry (r, c) is the sum of pixels in rows < r and columns < c; the
+        # first row and column are never written and stay zero
+        self._table = array('l', (0 for _ in range((rows + 1) * (cols + 1))))
+
+
+    def fill(self, image):
+        """!
+        Fill the summed-area table in from an image.
+        @param image A flat array of pixel values stored row by row
+        """
+        table = self._table
+        cols = self.cols
+        width = cols + 1
+
+        idx = 0
+        for row in range(1, self.rows + 1):
+            above = (row - 1) * width + 1
+            here = row * width + 1
+            running = 0
+            for col in range(cols):
+                running += image[idx]
+                table[here + col] = table[above + col] + running
+                idx += 1
+
+
+    def search(self, image):
+        """!
+        Find the block with the greatest sum. Where blocks tie, the first one
+        found going row by row from the top left wins.
+        @param image A flat array of pixel values stored row by row
+        @return A tuple @c (row, col, total) giving the top left pixel of the
+                best block and the sum of its pixels
+        """
+        self.fill(image)
+        table = self._table
+        line = self.cols + 1
+        height = self.block_size
+        width = self.block_width
+        stride = self.stride
+
+        best_sum = None
+        best_row, best_col = 0, 0
+        for row in range(0, self.rows - height + 1, stride):
+            top = row * line
+            bottom = top + height * line
+            for col in range(0, self.cols - width + 1, stride):
+                total = (table[bottom + col + width] - table[bottom + col]
+                         - table[top + col + width] + table[top + col])
+                if best_sum is None or total > best_sum:
+                    best_sum = total
+                    best_row, best_col = row, col
+
+        return best_row, best_col, best_sum
+
+
+class TopBlockSearch(IntegralBlockSearch):
+    """!
+    Finds the few blocks of pixels with the greatest sums which don't overlap
+    one another, so that several targets in view are found from one frame.
+
+    The summed-area table gives the sum of every block, which are kept in an
+    array. The best block is taken, then the best which doesn't overlap it,
+    and so on, which is called non-maximum suppression. Blocks which overlap
+    one already taken are passed over, so each target is found only once
+    however many blocks cover it. Blocks which are much cooler than the best
+    one are not found at all, since those left beside a target once its
+    middle is taken would otherwise be aimed at as targets of their own.
+    """
+
+    def __init__(self, block_size=5, count=3, stride=1, rows=NUM_ROWS,
+                 cols=NUM_COLS, block_width=None, min_total=None,
+                 min_fraction=0.0):
+        """!
+        Allocate the arrays used by the search.
+        @param block_size The height and width of the blocks searched
+        @param count The most blocks to be found in each image
+        @param stride The distance in pixels between blocks tried, in both
+               directions
+        @param rows The number of rows of pixels in an image
+        @param cols The number of columns of pixels in an image
+        @param block_width The width of the blocks, if not @c block_size
+        @param min_total Blocks whose sum is less than this aren't found, or
+               @c None to find blocks however small their sum
+        @param min_fraction Blocks whose sum is less than this fraction of
+               the best block's aren't found, which keeps out the edges of a
+               target left over once its middle has been taken
+        """
+        super().__init__(block_size, stride, rows, cols, block_width)
+        self.count = count
+        self.min_total = min_total
+        self.min_fraction = min_fraction
+
+        # The number of blocks tried across and down the image
+        self._across = (cols - self.block_width) // stride + 1
+        self._down = (rows - block_size) // stride + 1
+
+        # The sum of each block tried, row by row
+        self._sums = array('l', (0 for _ in range(self._across * self._down)))
+
+
+    def search_top(self, image):
+        """!
+        Find the blocks with the greatest sums which don't overlap. Where
+        blocks tie, the first one found going row by row from the top left
+        wins, so the first block found is the one @c search() finds.
+        @param image A flat array of pixel values stored row by row
+        @return A list of up to @c count tuples @c (row, col, total), each
+                giving the top left pixel of a block and the sum of its
+                pixels, best first; it is empty if even the best block is
+                below @c min_total
+        """
+        self.fill(image)
+        table = self._table
+        sums = self._sums
+        line = self.cols + 1
+        height = self.block_size
+        width = self.block_width
+        stride = self.stride
+        across = self._across
+
+        pos = 0
+        for row in range(0, self._down * stride, stride):
+            top = row * line
+            bottom = top + height * line
+            for col in range(0, across * stride, stride):
+                sums[pos] = (table[bottom + col + width] - table[bottom + col]
+                             - table[top + col + width] + table[top + col])
+                pos += 1
+
+        return _top_blocks(sums, across, stride, height, width, self.count,
+                           self.min_total, self.min_fraction)
+
+
+class ColumnSumSearch:
+    """!
+    Finds the block of pixels with the greatest sum using running column
+    sums, for when there is no room for a summed-area table.
+
+    The search keeps one row of sums, each of a column of pixels as tall as
+    a block. Moving down a row adds the pixel entering each column and takes
+    away the one leaving it, and moving along a row adds the column sum
+    entering the block and takes away the one leaving it. Each block then
+    costs a few additions, and the only memory needed is four bytes for each
+    column of the image.
+    """
+
+    def __init__(self, block_size=5, stride=1, rows=NUM_ROWS, cols=NUM_COLS,
+                 block_width=None):
+        """!
+        Allocate the row of column sums used by the search.
+        @param block_size The height and width of the blocks searched
+        @param stride The distance in pixels between blocks tried, in both
+               directions
+        @param rows The number of rows of pixels in an image
+        @param cols The number of columns of pixels in an image
+        @param block_width The width of the blocks, if not @c block_size
+        """
+        self.block_size = block_size
+        self.block_width = block_size if block_width is None else block_width
+        self.stride = stride
+        self.rows = rows
+        self.cols = cols
+
+        # The sum of block_size pixels going down from each pixel in the row
+        # where the blocks being tried start
+        self._col_sums = array('l', (0 for _ in range(cols)))
+
+
+    def search(self, image):
+        """!
+        Find the block with the greatest sum. Where blocks tie, the first one
+        found going row by row from the top left wins.
+        @param image A flat array of pixel values stored row by row
+        @return A tuple @c (row, col, total) giving the top left pixel of the
+                best block and the sum of its pixels
+        """
+        sums = self._col_sums
+        cols = self.cols
+        height = self.block_size
+        width = self.block_width
+        stride = self.stride
+
+        for col in range(cols):
+            total = 0
+            for idx in range(col, height * cols + col, cols):
+                total += image[idx]
+            sums[col] = total
+
+        best_sum = None
+        best_row, best_col = 0, 0
+        for row in range(self.rows - height + 1):
+            if row:
+                leaving = (row - 1) * cols
+                entering = leaving + height * cols
+                for col in range(cols):
+                    sums[col] += image[entering + col] - image[leaving + col]
+            if row % stride:
+                continue
+
+            total = 0
+            for col in range(width):
+                total += sums[col]
+            for col in range(cols - width + 1):
+                if col:
+                    total += sums[col + width - 1] - sums[col - 1]
+                if col % stride == 0 and (best_sum is None
+                                          or total > best_sum):
+                    best_sum = total
+                    best_row, best_col = row, col
+
+        return best_row, best_col, best_sum
@@ -0,0 +1,136 @@
+"""! @file target_tracker.py
+    This file contains a filter which follows a moving target from the
+    turret's camera measurements and predicts where it will be, so the
+    turret can aim where the target will be when the dart arrives rather
+    than where the camera last saw it.
+"""
+
+import utime
+
+
+class AlphaBetaTracker:
+    """!
+    Follows the position and velocity of a target on two axes with an
+    alpha-beta filter, which is a Kalman filter with fixed gains.
+
+    Each measurement is compared with where the target was expected to be.
+    A fraction @c alpha of the difference corrects the position and a
+    fraction @c beta, divided by the time since the last measurement,
+    corrects the velocity. Higher gains follow turns sooner; lower gains
+    smooth out more of the noise in the measurements. The velocity starts
+    from the difference between the first two measurements. A measurement
+    further than @c gate from where the target was expected is taken to be
+    of something else and is passed over.
+    """
+
+    def __init__(self, alpha=0.7, beta=0.4, max_gap_ms=1000, gate=None):
+        """!
+        Set up a tracker with no target.
+        @param alpha The share of each position error taken up at once
+        @param beta The share of each position error, per time between
+               measurements, taken up into the velocity
+        @param max_gap_ms If this long passes between measurements the
+               target is taken to be a new one, and predictions never look
+               further ahead of the last measurement than this
+        @param gate The furthest a measurement may be from the predicted
+               position on either axis to be taken as the same target, or
+               @c None to take any measurement
+        """
+        self.alpha = alpha
+        self.beta = beta
+        self.max_gap_ms = max_gap_ms
+        self.gate = gate
+
+        ## The estimated position on each axis
+        self.x = 0.0
+        self.y = 0.0
+        ## The estimated velocity on each axis, in units per millisecond
+        self.vx = 0.0
+        self.vy = 0.0
+        ## The @c ticks_ms() time of the last measurement, or @c None
+        self.timestamp = None
+        ## The number of measurements of the current target
+        self.updates = 0
+
+
+    @property
+    def valid(self):
+        """!
+        @c True while the tracker has a target which was last measured no
+        more than @c max_gap_ms ago.
+        """
+        return (self.timestamp is not None
+                and utime.ticks_diff(utime.ticks_ms(), self.timestamp)
+                <= self.max_gap_ms)
+
+
+    def reset(self):
+        """!
+        Forget the target, so the next measurement starts a new one.
+        """
+        self.vx = self.vy = 0.0
+        self.timestamp = None
+        self.updates = 0
+
+
+    def update(self, x, y, timestamp=None):
+        """!
+        Correct the estimates with a new measurement.
+        @param x The measured position on the first axis
+        @param y The measured position on the second axis
+        @param timestamp The @c ticks_ms() time at which the measurement was
+               made, or @c None for now
+        @return @c True if the measurement was used, @c False if it was too
+                far from the predicted position
+        """
+        if timestamp is None:
+            timestamp = utime.ticks_ms()
+        if self.timestamp is None:
+            dt = self.max_gap_ms + 1
+        else:
+            dt = utime.ticks_diff(timestamp, self.timestamp)
+
+        if dt > self.max_gap_ms:
+            # A new target, or one seen too long ago to go on from
+            self.x, self.y = x, y
+            self.vx = self.vy = 0.0
+            self.timestamp = timestamp
+            self.updates = 1
+            return True
+
+        err_x = x - (self.x + self.vx * dt)
+        err_y = y - (self.y + self.vy * dt)
+        if self.gate is not None and (abs(err_x) > self.gate
+                                      or abs(err_y) > self.gate):
+            return False
+
+        if self.updates == 1 and dt > 0:
+            # Two measurements give a velocity to start from
+            self.vx = (x - self.x) / dt
+            self.vy = (y - self.y) / dt
+            self.x, self.y = x, y
+            self.timestamp = timestamp
+            self.updates = 2
+            return True
+
+        self.x += self.vx * dt + self.alpha * err_x
+        self.y += self.vy * dt + self.alpha * err_y
+        if dt > 0:
+            self.vx += self.beta * err_x / dt
+            self.vy += self.beta * err_y / dt
+            self.timestamp = timestamp
+        self.updates += 1
+        return True
+
+
+    def predict(self, timestamp=None):
+        """!
+        Predict where the target will be at some time.
+        @param timestamp The @c ticks_ms() time at which the target's
+               position is wanted, or @c None for now
+        @return A tuple @c (x, y) of the predicted position
+        """
+        if timestamp is None:
+            timestamp = utime.ticks_ms()
+        dt = min(utime.ticks_diff(timestamp, self.timestamp), self.max_gap_ms)
+        return self.x + self.vx * dt, self.y + self.vy * dt
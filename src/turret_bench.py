@@ -0,0 +1,783 @@
+"""!
+@file turret_bench.py
+This file contains host benchmarks for the turret's camera and targeting
+tasks. The thermal camera is replaced by a fake I2C bus which produces new
+subpages on a timer and takes as long as a real bus to move data, so the
+cooperative scheduler can be exercised on a PC with the MicroPython Unix port,
+or with CPython 3 and the MicroPython stand-ins in @c host_shim:
+@code
+micropython turret_bench.py
+PYTHONPATH=host_shim python3 turret_bench.py
+@endcode
+"""
+
+import sys
+import utime
+from array import array
+
+# The camera driver imports its own modules as package "mlx90640"
+sys.path.append("mlx_raw")
+
+import cotask
+from mlx_cam import MLX_Cam, ACQ_BUSY, ACQ_FRAME
+from mlx_raw.mlx90640.fake_i2c import FakeI2C
+from mlx_raw.mlx90640.calibration import NUM_ROWS, NUM_COLS, IMAGE_SIZE
+from mlx_raw.mlx90640.image import ChessPattern, BadPixelPlan, RawImage
+from target_tracker import AlphaBetaTracker
+from aim_table import AimTable, pixel_angle
+from target_search import SubpageBlockSearch, BruteForceSearch, \
+    IntegralBlockSearch, ColumnSumSearch, TopBlockSearch, ForegroundFilter, \
+    block_centroid
+
+## How long each scheduling benchmark runs, in milliseconds
+RUN_MS = 3000
+
+## How many synthetic frames the search benchmarks use
+FRAMES = 20
+
+## The block size used by the search benchmarks
+BLOCK = 5
+
+## The whole-frame search kernels compared by the benchmarks
+FRAME_SEARCHES = (BruteForceSearch, IntegralBlockSearch, ColumnSumSearch)
+
+## Time between subpages from the fake camera in microseconds (4 Hz)
+SUBPAGE_US = 250_000
+
+
+def make_camera():
+    """!
+    Create a camera wrapper talking to a fake camera which runs in real time.
+    @returns A new @c MLX_Cam object
+    """
+    i2c = FakeI2C(frame_us=SUBPAGE_US, realtime=True)
+    return MLX_Cam(i2c)
+
+
+def control_task():
+    """!
+    A stand-in for a motor control task which does almost nothing, so its
+    lateness is caused only by the other tasks.
+    """
+    while True:
+        yield 0
+
+
+def blocking_camera_task(shares):
+    """!
+    A camera task which gets frames the old way, with @c get_image().
+    """
+    camera, frames = shares
+    while True:
+        camera.get_image()
+        frames.append(utime.ticks_ms())
+        yield 0
+
+
+def cooperative_camera_task(shares):
+    """!
+    A camera task which gets frames with the @c acquire() generator.
+    """
+    camera, frames = shares
+    acquisition = camera.acquire()
+    while True:
+        if next(acquisition) == ACQ_FRAME:
+            frames.append(utime.ticks_ms())
+        yield 0
+
+
+def bench_control_latency():
+    """!
+    Measure how late a 10 ms control task runs while each kind of camera task
+    gets frames beside it.
+    """
+    for camera_fun in (blocking_camera_task, cooperative_camera_task):
+        frames = []
+        # made first, as reading its EEPROM takes a while
+        cam = make_camera()
+        tasks = cotask.TaskList()
+        control = cotask.Task(control_task, name="Control", priority=2,
+                              period=10, profile=True)
+        camera = cotask.Task(camera_fun, name="Camera", priority=1,
+                             period=20, shares=(cam, frames))
+        tasks.append(control)
+        tasks.append(camera)
+
+        begin = utime.ticks_ms()
+        while utime.ticks_diff(utime.ticks_ms(), begin) < RUN_MS:
+            tasks.pri_sched()
+
+        runs = max(control._runs, 1)
+        print(f"\n{camera_fun.__name__:<24} {len(frames):>3} frames, "
+              f"control task late {control._late_sum // runs:>6} us avg, "
+              f"{control._latest:>6} us max")
+
+
+def synthetic_frames(count, seed=1, step=(5, 7)):
+    """!
+    Make repeatable test frames: noise over a warm background with a hot
+    blob which moves from frame to frame.
+    @param count The number of frames to make
+    @param seed A seed for the pseudo-random noise
+    @param step The rows and columns the blob moves between frames
+    @returns A list of flat arrays of pixel values
+    """
+    frames = []
+    state = seed
+    for n in range(count):
+        hot_row = 3 + (n * step[0]) % (NUM_ROWS - 6)
+        hot_col = 3 + (n * step[1]) % (NUM_COLS - 6)
+        frame = array('h', (0 for _ in range(IMAGE_SIZE)))
+        for idx in range(IMAGE_SIZE):
+            state = (state * 1103515245 + 12345) & 0x7FFFFFFF
+            row, col = divmod(idx, NUM_COLS)
+            dist = abs(row - hot_row) + abs(col - hot_col)
+            frame[idx] = 200 + (state >> 16) % 40 + max(0, 300 - 60 * dist)
+        frames.append(frame)
+    return frames
+
+
+def brute_force_search(pix, block=BLOCK):
+    """!
+    The original search: add up every block from scratch.
+    @returns A tuple @c (row, col, total) for the best block
+    """
+    best = None
+    for row in range(NUM_ROWS - block + 1):
+        for col in range(NUM_COLS - block + 1):
+            total = sum(sum(pix[(row + i) * NUM_COLS + col + j]
+                            for j in range(block)) for i in range(block))
+            if best is None or total > best[2]:
+                best = (row, col, total)
+    return best
+
+
+def bench_subpage_search():
+    """!
+    Compare finding the target from whole frames with updating it from each
+    subpage, and check that both agree once a frame is complete.
+    """
+    frames = synthetic_frames(FRAMES)
+    search = SubpageBlockSearch(BLOCK)
+    live = array('h', (0 for _ in range(IMAGE_SIZE)))
+    full_us = sub_us = updates = 0
+    mismatches = 0
+    for frame in frames:
+        for sp_id in (0, 1):
+            indices = ChessPattern.sp_range(sp_id)
+            for idx in indices:
+                live[idx] = frame[idx]
+            begin = utime.ticks_us()
+            search.update(live, indices, sp_id)
+            result = search.best()
+            sub_us += utime.ticks_diff(utime.ticks_us(), begin)
+            updates += 1
+
+        begin = utime.ticks_us()
+        expected = brute_force_search(frame)
+        full_us += utime.ticks_diff(utime.ticks_us(), begin)
+        if result != expected:
+            mismatches += 1
+
+    print(f"brute force per frame    {full_us // FRAMES:>7} us")
+    print(f"subpage update per subpage {sub_us // updates:>5} us, "
+          f"{mismatches} mismatches")
+
+
+def bench_dead_pixel():
+    """!
+    Check that a stuck pixel, repaired as the camera driver does, no longer
+    draws the target away from the real hot spot.
+    """
+    stuck = 2 * NUM_COLS + 28
+    plan = BadPixelPlan((stuck,))
+    wrong = [0, 0]
+    for frame in synthetic_frames(FRAMES, seed=7):
+        expected = brute_force_search(frame)
+        frame[stuck] = 30000
+        for repair in (False, True):
+            if repair:
+                plan.apply(frame)
+            if brute_force_search(frame)[:2] != expected[:2]:
+                wrong[repair] += 1
+    print(f"stuck pixel wins         {wrong[0]:>3} of {FRAMES} frames unrepaired, "
+          f"{wrong[1]} repaired")
+
+
+def csv_frame(camera, image):
+    """!
+    The old hand-off from camera to search: print the frame to CSV text and
+    parse it back into a list of rows.
+    """
+    cam_data = []
+    for line in camera.get_csv(image, limits=(0, 99)):
+        cam_data.append(list(map(int, line.split(','))))
+    return cam_data
+
+
+def bench_frame_handoff():
+    """!
+    Compare the CSV hand-off of scaled frames with writing them into a
+    buffer with @c get_scaled(), showing the heap allocated per frame (with
+    garbage collection held off) and the time taken.
+    """
+    import gc
+
+    camera = make_camera()
+    image = RawImage()
+    scaled = bytearray(IMAGE_SIZE)
+    mismatches = 0
+    results = {}
+    for mode in ("csv", "get_scaled"):
+        elapsed = allocated = 0
+        for frame in synthetic_frames(FRAMES):
+            image.pix[:] = frame
+            gc.collect()
+            gc.disable()
+            heap = gc.mem_alloc()
+            begin = utime.ticks_us()
+            if mode == "csv":
+                rows = csv_frame(camera, image)
+            else:
+                camera.get_scaled(image, scaled, limits=(0, 99))
+            elapsed += utime.ticks_diff(utime.ticks_us(), begin)
+            allocated += gc.mem_alloc() - heap
+            gc.enable()
+            flat = ([value for row in rows for value in row]
+                    if mode == "csv" else list(scaled))
+            results.setdefault(mode, []).append(flat)
+        print(f"{mode + ' hand-off':<24} {elapsed // FRAMES:>7} us "
+              f"{allocated // FRAMES:>7} bytes allocated per frame")
+    for old, new in zip(results["csv"], results["get_scaled"]):
+        if old != new:
+            mismatches += 1
+    print(f"hand-off mismatches      {mismatches:>3} of {FRAMES} frames")
+
+
+def bench_frame_search():
+    """!
+    Time the whole-frame searches on the same frames, checking each against
+    the original search (or the plain brute force search, for strides over
+    one) so that all give the same block.
+    """
+    frames = synthetic_frames(FRAMES)
+    expected = [brute_force_search(frame) for frame in frames]
+    for stride, width in ((1, BLOCK), (2, BLOCK), (1, BLOCK + 2)):
+        if stride > 1 or width != BLOCK:
+            reference = BruteForceSearch(BLOCK, stride, block_width=width)
+            expected = [reference.search(frame) for frame in frames]
+        for kind in FRAME_SEARCHES:
+            search = kind(BLOCK, stride, block_width=width)
+            elapsed = mismatches = 0
+            for frame, result in zip(frames, expected):
+                begin = utime.ticks_us()
+                found = search.search(frame)
+                elapsed += utime.ticks_diff(utime.ticks_us(), begin)
+                if found != result:
+                    mismatches += 1
+            print(f"{kind.__name__ + f' {BLOCK}x{width}/{stride}':<28} "
+                  f"{elapsed // FRAMES:>7} us per frame, "
+                  f"{mismatches} mismatches")
+
+    # The generator expressions the targeting task used to add up blocks
+    begin = utime.ticks_us()
+    for frame in frames:
+        brute_force_search(frame)
+    elapsed = utime.ticks_diff(utime.ticks_us(), begin)
+    print(f"{'original search':<28} {elapsed // FRAMES:>7} us per frame")
+
+
+def bench_search_memory():
+    """!
+    Show the heap each whole-frame search takes: what it keeps between
+    frames, and the most in use while searching a frame, with garbage
+    collection held off so nothing allocated is freed.
+    """
+    import gc
+
+    frame = synthetic_frames(1)[0]
+    for kind in FRAME_SEARCHES:
+        gc.collect()
+        gc.disable()
+        heap = gc.mem_alloc()
+        search = kind(BLOCK)
+        kept = gc.mem_alloc() - heap
+        search.search(frame)
+        peak = gc.mem_alloc() - heap
+        gc.enable()
+        del search
+        print(f"{kind.__name__:<28} {kept:>7} bytes kept, "
+              f"{peak:>7} bytes peak")
+
+
+def greedy_targets(pix, count, block=BLOCK, min_fraction=0.0):
+    """!
+    A plain reference for the multiple target search: add up every block,
+    then take the best blocks in turn, skipping those overlapping one taken
+    and stopping at the first below @c min_fraction of the best.
+    @returns A list of tuples @c (row, col, total), best first
+    """
+    blocks = []
+    for row in range(NUM_ROWS - block + 1):
+        for col in range(NUM_COLS - block + 1):
+            total = sum(sum(pix[(row + i) * NUM_COLS + col + j]
+                            for j in range(block)) for i in range(block))
+            blocks.append((row, col, total))
+    # sorted() is stable, so ties stay in the order they were found
+    blocks = sorted(blocks, key=lambda found: -found[2])
+    taken = []
+    for row, col, total in blocks:
+        if len(taken) == count or (taken
+                                   and total < taken[0][2] * min_fraction):
+            break
+        if all(abs(row - r) >= block or abs(col - c) >= block
+               for r, c, _ in taken):
+            taken.append((row, col, total))
+    return taken
+
+
+def bench_multi_target(count=3, min_fraction=0.25):
+    """!
+    Put a second, cooler hot spot in each frame and check that the multiple
+    target search finds both, agreeing with a plain reference, and that its
+    best target is the one the single target search finds, and that the
+    running sums of the subpage search pick the same blocks. The frames have
+    their background taken away, as the foreground filter would. Blocks found
+    away from both spots are counted as spurious; with @c min_fraction
+    zero these are the edges of the spots left once their middles are
+    taken, and with it set there should be none.
+    """
+    frames = synthetic_frames(FRAMES, seed=3)
+    single = IntegralBlockSearch(BLOCK)
+    top = TopBlockSearch(BLOCK, count, min_fraction=min_fraction)
+    running = SubpageBlockSearch(BLOCK, count=count,
+                                 min_fraction=min_fraction)
+    single_us = top_us = running_us = mismatches = second = spurious = 0
+    for n, frame in enumerate(frames):
+        other_row = 2 + (n * 3) % (NUM_ROWS - 4)
+        other_col = NUM_COLS - 3 - (n * 5) % (NUM_COLS - 4)
+        for idx in range(IMAGE_SIZE):
+            row, col = divmod(idx, NUM_COLS)
+            dist = abs(row - other_row) + abs(col - other_col)
+            frame[idx] += max(0, 200 - 50 * dist)
+        # What the foreground filter would leave of the warm background
+        for idx in range(IMAGE_SIZE):
+            frame[idx] = max(0, frame[idx] - 240)
+
+        begin = utime.ticks_us()
+        best = single.search(frame)
+        single_us += utime.ticks_diff(utime.ticks_us(), begin)
+        begin = utime.ticks_us()
+        found = top.search_top(frame)
+        top_us += utime.ticks_diff(utime.ticks_us(), begin)
+        running.update(frame, range(IMAGE_SIZE))
+        begin = utime.ticks_us()
+        kept = running.best_blocks()
+        running_us += utime.ticks_diff(utime.ticks_us(), begin)
+
+        if (found != greedy_targets(frame, count, min_fraction=min_fraction)
+                or found[0] != best or kept != found):
+            mismatches += 1
+        # Where synthetic_frames() put the first spot
+        hot_row = 3 + (n * 5) % (NUM_ROWS - 6)
+        hot_col = 3 + (n * 7) % (NUM_COLS - 6)
+        for row, col, _ in found:
+            row += BLOCK // 2
+            col += BLOCK // 2
+            if abs(row - other_row) <= 1 and abs(col - other_col) <= 1:
+                second += 1
+            elif abs(row - hot_row) > 1 or abs(col - hot_col) > 1:
+                spurious += 1
+
+    print(f"{'single target search':<28} {single_us // FRAMES:>7} us per frame")
+    print(f"{f'top {count} target search':<28} {top_us // FRAMES:>7} us per frame, "
+          f"{mismatches} mismatches, second spot found in {second} "
+          f"of {FRAMES} frames, {spurious} spurious blocks")
+    print(f"{f'top {count} from running sums':<28} "
+          f"{running_us // FRAMES:>7} us per frame")
+
+
+def bench_window_tracking():
+    """!
+    Follow a slowly moving hot spot, reading whole frames or a window around
+    the last target, and compare the bus time and search time per frame.
+    The target found should be the one a whole frame would give, except in
+    a windowed frame just after the spot jumps out of the window, where it
+    is lost and a whole frame is read next.
+    """
+    frames = synthetic_frames(FRAMES * 2, seed=5, step=(1, 1))
+    for window in (None, (10, 10)):
+        i2c = FakeI2C()
+        camera = MLX_Cam(i2c, window=window, full_every=8)
+        acquisition = camera.acquire()
+        search = SubpageBlockSearch(BLOCK)
+        bus_us = search_us = mismatches = windowed = 0
+        for frame in frames:
+            i2c.fill(0x0400, frame)
+            i2c.reset_counts()
+            for sp_id in (0, 1):
+                i2c.mem[0x8000] = 0x0008 | sp_id
+                while next(acquisition) == ACQ_BUSY:
+                    pass
+                image, indices = camera.last_subpage()
+                begin = utime.ticks_us()
+                search.update(image.pix, indices, sp_id)
+                search.update(image.pix, camera.repaired())
+                found = search.best()
+                search_us += utime.ticks_diff(utime.ticks_us(), begin)
+            bus_us += i2c.bus_time_us()
+            windowed += camera.windowed
+            camera.track(found[0] + BLOCK // 2, found[1] + BLOCK // 2)
+            if found[:2] != brute_force_search(frame)[:2]:
+                mismatches += 1
+        name = "whole frames" if window is None else f"window {window}"
+        print(f"{name:<24} bus {bus_us // len(frames):>6} us, "
+              f"search {search_us // len(frames):>5} us per frame, "
+              f"{windowed} windowed, {mismatches} mismatches")
+
+
+def bench_centroid(trials=200):
+    """!
+    Put a round hot spot at a random spot between pixels and compare how far
+    from it the middle of the best block and the weighted centre of that
+    block land, both with the background taken from the block and with a
+    background level given.
+    """
+    state = 11
+    errors = [0.0, 0.0, 0.0]
+    elapsed = 0
+    frame = array('h', (0 for _ in range(IMAGE_SIZE)))
+    for _ in range(trials):
+        state = (state * 1103515245 + 12345) & 0x7FFFFFFF
+        spot_row = 4 + (state >> 8) % 1600 / 100
+        state = (state * 1103515245 + 12345) & 0x7FFFFFFF
+        spot_col = 4 + (state >> 8) % 2400 / 100
+        for idx in range(IMAGE_SIZE):
+            state = (state * 1103515245 + 12345) & 0x7FFFFFFF
+            row, col = divmod(idx, NUM_COLS)
+            dist = ((row - spot_row) ** 2 + (col - spot_col) ** 2) ** 0.5
+            frame[idx] = int(200 + (state >> 16) % 20
+                             + max(0.0, 300 - 120 * dist))
+
+        row, col, _ = brute_force_search(frame)
+        middle = (row + BLOCK // 2, col + BLOCK // 2)
+        begin = utime.ticks_us()
+        centre = block_centroid(frame, row, col, BLOCK)
+        elapsed += utime.ticks_diff(utime.ticks_us(), begin)
+        given = block_centroid(frame, row, col, BLOCK, background=220)
+        for n, found in enumerate((middle, centre, given)):
+            errors[n] += ((found[0] - spot_row) ** 2
+                          + (found[1] - spot_col) ** 2) ** 0.5
+
+    for name, error in zip(("block middle", "weighted centre",
+                            "weighted, background 220"), errors):
+        print(f"{name:<28} {error / trials:>6.3f} pixels mean error")
+    print(f"{'block_centroid':<28} {elapsed // trials:>6} us")
+
+
+class SimClock:
+    """!
+    Stands in for @c utime in the modules under test, so a run of the real
+    tasks can be stepped through simulated time as fast as it will go.
+    """
+
+    def __init__(self):
+        ## The simulated time in milliseconds
+        self.now_ms = 0
+
+    def ticks_ms(self):
+        return self.now_ms
+
+    def ticks_us(self):
+        return self.now_ms * 1000
+
+    def ticks_add(self, ticks, delta):
+        return ticks + delta
+
+    def ticks_diff(self, ticks1, ticks2):
+        return ticks1 - ticks2
+
+    def sleep_ms(self, ms):
+        self.now_ms += ms
+
+
+def walkers(seed):
+    """!
+    Make a repeatable scene of two people crossing the field of view at
+    different speeds, one turning part way, who walk out near the end.
+    @returns A function giving a list of the @c (row, col) positions as read
+             by the camera of the people in view at a time in ms
+    """
+    speed_a = 0.0020 + seed % 4 * 0.0005
+    speed_b = 0.0010 - seed % 3 * 0.0005
+    turn_ms = 3500 + seed % 5 * 300
+
+    def people(t):
+        if t < 1000 or t >= 9000:
+            return []
+        t -= 1000
+        row_a = 8.0 + min(t, turn_ms) * 0.0005 + max(0, t - turn_ms) * 0.001
+        col_a = 4.0 + speed_a * t
+        return [(row_a, col_a), (17.0, 26.0 - speed_b * t)]
+
+    return people
+
+
+def scene_frame(frame, people, state):
+    """!
+    Fill a frame with noise over a warm background and a hot blob for each
+    person, the first one hotter.
+    @returns The new state of the pseudo-random noise
+    """
+    for idx in range(IMAGE_SIZE):
+        state = (state * 1103515245 + 12345) & 0x7FFFFFFF
+        row, col = divmod(idx, NUM_COLS)
+        value = 200 + (state >> 16) % 30
+        for n, (p_row, p_col) in enumerate(people):
+            dist = abs(row - p_row) + abs(col - p_col)
+            value += max(0, (300 - 60 * n) - 60 * dist)
+        frame[idx] = int(value)
+    return state
+
+
+def run_target_task(gains, lead_ms, seed, length_ms=10000, slew=1.0,
+                    flight_ms=350, step_ms=10):
+    """!
+    Run the real @c main.get_target_task1() on a fake camera watching two
+    people walk by, with a simple turret which turns at most @c slew ticks
+    per ms on each axis towards the target shares. Once within 5 ticks of
+    both, it fires as @c main.shoot_task4() does: the dart leaves 200 ms
+    later and lands @c flight_ms after that, and @c targ_acquired is
+    cleared so the next target is taken.
+    @param gains The tracker's @c (alpha, beta), or @c None
+    @param lead_ms The value of @c main.AIM_LEAD_MS
+    @returns A tuple @c (misses, windowed) of a list holding the distance in
+             ticks from each dart to the nearest person when it lands, and
+             whether the camera was still reading a window at the end
+    """
+    import main
+    import target_queue
+    import target_tracker
+
+    clock = SimClock()
+    i2c = FakeI2C()
+    cameras = []
+
+    class SimCam(MLX_Cam):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            cameras.append(self)
+
+    saved = (main.utime, target_queue.utime, target_tracker.utime, main.I2C,
+             main.MLX_Cam, main.TRACKER_GAINS, main.AIM_LEAD_MS)
+    main.utime = target_queue.utime = target_tracker.utime = clock
+    # Keep the task's messages out of the results
+    main.print = lambda *args: None
+    main.I2C = lambda bus: i2c
+    main.MLX_Cam = SimCam
+    main.TRACKER_GAINS = gains
+    main.AIM_LEAD_MS = lead_ms
+    try:
+        shares = (main.task_share.Share('f'), main.task_share.Share('f'),
+                  main.task_share.Share('b'))
+        target_x, target_y, acquired = shares
+        target_x.put(0)
+        target_y.put(0)
+        acquired.put(0)
+        task = main.get_target_task1(shares)
+
+        people = walkers(seed)
+        frame = array('h', (0 for _ in range(IMAGE_SIZE)))
+        state = seed
+        pos_x = pos_y = 0.0
+        landing = []
+        misses = []
+        for t in range(0, length_ms, step_ms):
+            clock.now_ms = t
+            if t % (SUBPAGE_US // 1000) == 0:
+                state = scene_frame(frame, people(t), state)
+                i2c.fill(0x0400, frame)
+                i2c.mem[0x8000] = 0x0008 | (t // (SUBPAGE_US // 1000)) % 2
+            next(task)
+
+            while landing and landing[0][0] <= t:
+                _, shot_x, shot_y = landing.pop(0)
+                near = None
+                for row, col in people(t):
+                    miss = ((main.process_target(NUM_COLS - 1 - col, True)
+                             - shot_x) ** 2
+                            + (main.process_target(row, False)
+                               - shot_y) ** 2) ** 0.5
+                    if near is None or miss < near:
+                        near = miss
+                if near is not None:
+                    misses.append(near)
+
+            if acquired.get():
+                aim_x, aim_y = target_x.get(), target_y.get()
+                if abs(aim_x - pos_x) < 5 and abs(aim_y - pos_y) < 5:
+                    landing.append((t + 200 + flight_ms, pos_x, pos_y))
+                    acquired.put(0)
+                else:
+                    turn = slew * step_ms
+                    pos_x += max(-turn, min(turn, aim_x - pos_x))
+                    pos_y += max(-turn, min(turn, aim_y - pos_y))
+        return misses, cameras[0].windowed
+    finally:
+        (main.utime, target_queue.utime, target_tracker.utime, main.I2C,
+         main.MLX_Cam, main.TRACKER_GAINS, main.AIM_LEAD_MS) = saved
+        del main.print
+
+
+def bench_tracker(runs=6):
+    """!
+    Run the real targeting task on scenes of two people walking by, aiming
+    where each target was found, and following it with the tracker without
+    and with a lead, and compare how far the darts miss. The leads tried
+    show how to tune @c main.AIM_LEAD_MS for a turret and dart.
+    """
+    cases = (("no tracker", None, 0),
+             ("tracker, no lead", (0.7, 0.4), 0),
+             ("tracker, 200 ms lead", (0.7, 0.4), 200),
+             ("tracker, 400 ms lead", (0.7, 0.4), 400),
+             ("tracker, 600 ms lead", (0.7, 0.4), 600))
+    for name, gains, lead_ms in cases:
+        misses = []
+        still_windowed = 0
+        for seed in range(runs):
+            missed, windowed = run_target_task(gains, lead_ms, seed)
+            misses.extend(missed)
+            still_windowed += windowed
+        shots = max(len(misses), 1)
+        print(f"{name:<24} miss {sum(misses) / shots:>6.1f} ticks, "
+              f"{len(misses)} shots in {runs} runs, "
+              f"{still_windowed} runs still windowed with nobody in view")
+
+
+def bench_foreground(frames=40, minimum=200):
+    """!
+    Watch a scene with a lamp, hotter than any person, which stays put, and
+    a person who walks in after the background has been learned and steps
+    out for a while. Count the frames in which the raw search and the search
+    on the foreground find the person, and those in which nothing is found
+    because nobody is there.
+    """
+    state = 13
+    lamp_row, lamp_col = 6, 24
+    search = SubpageBlockSearch(BLOCK)
+    fore_search = SubpageBlockSearch(BLOCK)
+    foreground = ForegroundFilter()
+    raw_hits = fore_hits = empty = updates = elapsed = 0
+    skipped = [0, 0]
+    frame = array('h', (0 for _ in range(IMAGE_SIZE)))
+    for n in range(frames):
+        present = 10 <= n < 25 or n >= 30
+        spot_row = 5 + n % 14
+        spot_col = 4 + (n * 2) % 24
+        for idx in range(IMAGE_SIZE):
+            state = (state * 1103515245 + 12345) & 0x7FFFFFFF
+            row, col = divmod(idx, NUM_COLS)
+            value = 200 + (state >> 16) % 30
+            if abs(row - lamp_row) < 3 and abs(col - lamp_col) < 3:
+                value += 600
+            if present:
+                dist = abs(row - spot_row) + abs(col - spot_col)
+                value += max(0, 300 - 60 * dist)
+            frame[idx] = value
+
+        for sp_id in (0, 1):
+            indices = ChessPattern.sp_range(sp_id)
+            search.update(frame, indices, sp_id)
+            begin = utime.ticks_us()
+            foreground.update(frame, indices)
+            elapsed += utime.ticks_diff(utime.ticks_us(), begin)
+            updates += 1
+            fore_search.update(foreground.pix, indices, sp_id)
+
+        if not present:
+            empty += 1
+        found = search.best()
+        if present and abs(found[0] + BLOCK // 2 - spot_row) <= 1 \
+                and abs(found[1] + BLOCK // 2 - spot_col) <= 1:
+            raw_hits += 1
+        if foreground.energy < minimum:
+            skipped[present] += 1
+            continue
+        found = fore_search.best()
+        if present and abs(found[0] + BLOCK // 2 - spot_row) <= 1 \
+                and abs(found[1] + BLOCK // 2 - spot_col) <= 1:
+            fore_hits += 1
+
+    print(f"{'raw search':<28} person found in {raw_hits:>2} of "
+          f"{frames - empty} frames")
+    print(f"{'foreground search':<28} person found in {fore_hits:>2} of "
+          f"{frames - empty} frames")
+    print(f"{'passed over':<28} {skipped[0]:>2} of {empty} empty frames, "
+          f"{skipped[1]} with the person")
+    print(f"{'ForegroundFilter.update':<28} {elapsed // updates:>6} us "
+          f"per subpage")
+
+
+def old_process_target(coord, axis):
+    """!
+    The conversion from camera pixels to encoder ticks as it was, which
+    scaled the 55 degrees across the columns by the number of rows and the
+    35 degrees down the rows by the number of columns.
+    """
+    if axis:
+        cam_dist = coord - NUM_ROWS / 2
+        angle = (55 / 2) * (cam_dist / (NUM_ROWS / 2))
+    else:
+        cam_dist = coord - NUM_COLS / 2
+        angle = (35 / 2) * (cam_dist / (NUM_COLS / 2))
+    return angle * (16384 / 360)
+
+
+def bench_aim_table(steps=10):
+    """!
+    Check the pixel to encoder tick tables against the formula they are made
+    from at fractions of a pixel, with and without lens distortion, compare
+    the time taken with working the formula out each time, and show how far
+    off the old conversion was at the edges of the image.
+    """
+    coords = [n / steps for n in range((NUM_COLS - 1) * steps + 1)]
+    for distortion in (0.0, 0.1):
+        table = AimTable(NUM_COLS, 55, distortion)
+        worst = 0.0
+        for coord in coords:
+            exact = pixel_angle(coord, NUM_COLS, 55, distortion) * 16384 / 360
+            worst = max(worst, abs(table.ticks(coord) - exact))
+        print(f"AimTable distortion {distortion:<4} max error "
+              f"{worst:>6.2f} ticks")
+
+    table = AimTable(NUM_COLS, 55)
+    begin = utime.ticks_us()
+    for coord in coords:
+        table.ticks(coord)
+    table_us = utime.ticks_diff(utime.ticks_us(), begin)
+    begin = utime.ticks_us()
+    for coord in coords:
+        pixel_angle(coord, NUM_COLS, 55) * (16384 / 360)
+    formula_us = utime.ticks_diff(utime.ticks_us(), begin)
+    print(f"{'AimTable.ticks':<28} {table_us * 1000 // len(coords):>6} ns, "
+          f"formula {formula_us * 1000 // len(coords)} ns")
+
+    for axis, count, fov in ((True, NUM_COLS, 55), (False, NUM_ROWS, 35)):
+        edge = AimTable(count, fov).ticks(count - 1)
+        print(f"{'x' if axis else 'y'} edge pixel now {edge:>7.1f} ticks, "
+              f"was {old_process_target(count - 1, axis):>7.1f}")
+
+
+if __name__ == "__main__":
+    bench_control_latency()
+    bench_subpage_search()
+    bench_dead_pixel()
+    bench_frame_handoff()
+    bench_frame_search()
+    bench_search_memory()
+    bench_multi_target()
+    bench_window_tracking()
+    bench_centroid()
+    bench_tracker()
+    bench_foreground()
+    bench_aim_table()